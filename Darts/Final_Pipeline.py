@@ -11,59 +11,92 @@ References:
 Import libraries
 ================
 """
-import ast
 import pandas as pd
 import os
 import Darts.brock_comm_config as config
 from Darts.brock_comm_CLT_perform import Darts_CLT_Perform
 from Darts.regressor_helper import RegressHelp
-from darts import TimeSeries
+from export_helper import ExportHelp
+from plot_helper import PlotHelp
+from metrics_helper import stage_metrics
 from darts.models import ARIMA, RegressionModel, LightGBMModel
-import numpy as np
 
 
-def Darts_Pipeline():
-    #helper function 
-    def append_to_excel(fpath, df, sheet_name):
-        with pd.ExcelWriter(fpath,engine='openpyxl', mode="a", if_sheet_exists='replace') as f:
-            df.to_excel(f, sheet_name=sheet_name)
+def Darts_Pipeline(plots=None, files=None, columns=None, models=None, agg=True, forecast_horizon=300):
+    """
+    - plots: a PlotHelp to render the figures with, e.g. shared with Results_Analysis; the caller closes it.
+      Without it, the figures are rendered by a PlotHelp of this run, which is closed before returning
+    - files: names of the sensor files to forecast, defaults to every file in 'TALLWOOD DATA/BCTW Sensor Data'
+    - columns: names of the sensor columns to forecast (all of them if None), ignored if agg
+    - models: names of the models to run (some of config.MODEL_NAMES), defaults to all of them
+    - agg: if True, only the aggregate (mean) of the sensor columns of each file is forecast, which saves running time
+    - forecast_horizon: in 2-hour steps, 300 = 600 hr
+    """
+    # result sheets are buffered and written once at the end of the run
+    export = ExportHelp(store_path=config.RESULT_STORE_PATH, excel=config.RESULT_STORE_EXCEL)
+    # figures are rendered in the background while the results are exported
+    own_plots = plots is None
+    if own_plots:
+        plots = PlotHelp(config.PLOTS, config.PLOT_DPI, config.PLOT_FORMAT, config.PLOT_MAX_POINTS, config.PLOT_WORKERS)
 
-    fileList = os.listdir('TALLWOOD DATA/BCTW Sensor Data')
+    fileList = files if files is not None else os.listdir('TALLWOOD DATA/BCTW Sensor Data')
     #fileList = ["Floor 3.csv", "Floor 4.csv"]
-    
-    # If you want to save running time by using aggregate data, set agg==True; otherwise iterate the orginal complete dataset using False
-    agg=True
+    if models is None:
+        models = config.MODEL_NAMES
+    unknown_models = [name for name in models if name not in config.MODEL_NAMES]
+    if unknown_models:
+        raise ValueError(f"unknown models {unknown_models}, expecting some of {config.MODEL_NAMES}")
     
     MAE_dict = {}
-    model_mae_dict = {}
+    metrics_rows = [] # one row of every metric per model and file, see eval_helper.py
     prediction_dict = {}
     forecasts_all_dict = {}
 
+    # regression models fitted once on the series of every file when config.GLOBAL_MODEL is True (see Darts_CLT_Perform.fit_predict_global)
+    global_model_names = [name for name in config.GLOBAL_MODEL_NAMES if name in models] if config.GLOBAL_MODEL else []
+    global_inputs = [] # [(file, column name, train series, groundtruth)]
+    file_trials = {} # {file: (Darts_CLT_Perform, prediction_dict)}, results are collected once every model has forecast
+
+    def make_models():
+        # lags of the regression models are set per model in config.MODEL_LAGS, 'horizon' lags follow forecast_horizon
+        model_makers = {
+            "ARIMA": lambda: ARIMA(12,0,0),
+            "RegressionModel": lambda: RegressionModel(**Darts_CLT_Perform.model_lags("RegressionModel", forecast_horizon)),
+            "LightGBMModel": lambda: LightGBMModel(**Darts_CLT_Perform.model_lags("LightGBMModel", forecast_horizon))
+            #"RegressionModel": RegressionModel(None, None, [i for i in range(-300,1)]),
+            #"LightGBMModel": LightGBMModel([i for i in range(-300,0)], [i for i in range(-300,0)], [i for i in range(-300,0)], 300)
+        }
+        return {name: model_makers[name]() for name in config.MODEL_NAMES if name in models}
+
     for i in fileList:
         # prepare variables
         wb_name = i # sys path will be added within Darts_CLT_Perform
-        forecast_horizon = 300 # = 600 hr (interval is 2hr)
         forecast_params = {
             'periods': forecast_horizon, 
             'freq': '2H',
         }
         
-        trial_1 = Darts_CLT_Perform(wb_name, agg)
+        with stage_metrics.stage('ingest', series=i) as record:
+            trial_1 = Darts_CLT_Perform(wb_name, agg, columns)
+            record['rows'] = len(trial_1.worksheet)
         
         climate_data_csv = os.path.sep.join([config.CLIMATE_DATA_PATH,'Haney_UBC_RF_ADMIN_climate_daily_2016-2020.csv'])
         regress_try = RegressHelp()
-        regressor = regress_try.prepare_climate_regr(climate_data_csv, convert_day_to_hour_interval='2H',impute='mean')
+        with stage_metrics.stage('regressors', series=i):
+            regressor = regress_try.prepare_climate_regr(climate_data_csv, convert_day_to_hour_interval='2H',impute='mean', cache_dir=config.REGR_CACHE_PATH)
         print(regressor)
         regressor_lst = [(['MEAN_TEMPERATURE','TOTAL_PRECIPITATION'],regressor)]
-        cov_series = TimeSeries.from_dataframe(regressor, 'ds',['MEAN_TEMPERATURE', 'TOTAL_PRECIPITATION'], fill_missing_dates=True, freq='H', fillna_value=0)
+        # covariates at the native 2-hour frequency of the regressors, on the same grid as the sensor series
+        cov_series = trial_1.make_series(regressor, ['MEAN_TEMPERATURE', 'TOTAL_PRECIPITATION'])
         ws = trial_1.worksheet
-        nameList = list(ws)
-        nameList.remove('DateTime')
-        nameList.remove('Date')
-        nameList.remove('Time')
+        nameList = list(trial_1.data_columns)
         #nameList = ['W 3rd Edge MC1A (8912/19)']
         if agg==True:
             nameList = ['Aggregate']
+        elif columns is not None:
+            nameList = [columnName for columnName in nameList if columnName in columns]
+            if not nameList:
+                raise ValueError(f"none of the columns {columns} is in {i}")
         
         ''''
         gbmparam = {
@@ -73,22 +106,23 @@ def Darts_Pipeline():
             'output_chunk_length': [300]
         }'''
 
-        modelList = {
-            "ARIMA": ARIMA(12,0,0),
-            "RegressionModel": RegressionModel(None, None, [i for i in range(-(forecast_horizon-1),1)]),
-            "LightGBMModel": LightGBMModel(None, None, [i for i in range(-(forecast_horizon-1),1)])
-            #"RegressionModel": RegressionModel(None, None, [i for i in range(-300,1)]),
-            #"LightGBMModel": LightGBMModel([i for i in range(-300,0)], [i for i in range(-300,0)], [i for i in range(-300,0)], 300)
-        }
+        modelList = make_models()
     
         modelNameList = []
+        # impute and align regressors for every column at once, then pick one column at a time
+        with stage_metrics.stage('preprocess', series=i, rows=len(ws) * len(nameList)):
+            trial_1.preprocess_batch(nameList, in_sample_forecast=True, forecast_horizon=forecast_horizon, impute='mean', regressor_list=regressor_lst)
+        if not trial_1.batch_columns:
+            raise ValueError(f"none of the columns {nameList} of {i} has valid data")
     
         for modelName, Model in modelList.items():
             modelNameList.append(modelName)
-            for columnName in nameList:
+            if modelName in global_model_names:
+                continue
+            for columnName in trial_1.batch_columns:
                 # Create prediction results DataFrame
                 df = pd.DataFrame(columns=['ds', 'y'])
-                trial_1.preprocess(col_name=columnName, in_sample_forecast=True, forecast_horizon=forecast_horizon, impute='mean', regressor_list=regressor_lst)
+                trial_1.select_column(columnName)
                 t = trial_1.train_df.copy()
                 #t.columns = [c for c in t.columns if c not in ['ds']]
                 t['ds'] = pd.to_numeric(pd.to_datetime(t['ds']))
@@ -111,7 +145,12 @@ def Darts_Pipeline():
                     n_jobs=1, 
                     n_random_samples=None
                 )'''
-                trial_1.train_forecast_eval(trial_1.train_df, cov_series, forecast_horizon, groundtruth=trial_1.test_df, Name=modelName, model=Model)
+                stage_metrics.series = i[:-4] + '/' + columnName
+                with stage_metrics.stage(modelName + ' fit/predict', rows=len(trial_1.train_df)):
+                    trial_1.train_forecast_eval(trial_1.train_df, cov_series, forecast_horizon, groundtruth=trial_1.test_df, Name=modelName, model=Model)
+                with stage_metrics.stage('save model'):
+                    Darts_CLT_Perform.save_model(Model, modelName, i, columnName)
+                stage_metrics.series = None
                 data = trial_1.forecast_results[['ds', 'y']]
                 df = df.append(data, ignore_index=True)
                 prediction_dict[modelName] = df
@@ -120,16 +159,41 @@ def Darts_Pipeline():
                 print('This is the ' + modelName + ' forecast in ' + i)
         
     
+        # keep the series of every column for the global models
+        if global_model_names:
+            for columnName in trial_1.batch_columns:
+                trial_1.select_column(columnName)
+                global_inputs.append((i, columnName, trial_1.make_series(trial_1.train_df, ['y']), trial_1.test_df))
+        file_trials[i] = (trial_1, prediction_dict)
+        prediction_dict = {}
+
+    # fit each global model once on all series, then forecast them in one batched predict call
+    if global_model_names:
+        global_models = make_models()
+        series_list = [series for (_, _, series, _) in global_inputs]
+        for modelName in global_model_names:
+            with stage_metrics.stage(modelName + ' global fit/predict', rows=sum(len(series) for series in series_list)):
+                forecasts = Darts_CLT_Perform.fit_predict_global(modelName, global_models[modelName], series_list, cov_series, forecast_horizon)
+            with stage_metrics.stage('save model'):
+                Darts_CLT_Perform.save_model(global_models[modelName], modelName)
+            for (i, columnName, _, groundtruth), p in zip(global_inputs, forecasts):
+                trial_1, prediction_dict = file_trials[i]
+                trial_1.col_name = columnName
+                stage_metrics.series = i[:-4] + '/' + columnName
+                trial_1.collect_forecast(modelName, p, forecast_horizon, groundtruth=groundtruth)
+                stage_metrics.series = None
+                prediction_dict[modelName] = pd.DataFrame(columns=['ds', 'y']).append(trial_1.forecast_results[['ds', 'y']], ignore_index=True)
+                print('This is the global ' + modelName + ' forecast in ' + i)
+
+    for i, (trial_1, prediction_dict) in file_trials.items():
         #produce MAE df for each file
         # for method, result in trial_1.eval_results_dict.items():
         #     example_dict = dict({i[:-4] + '_aggr': result})
-        for eval_results_dict in trial_1.eval_results_dict_list:
+        for category, res_dict in trial_1.eval_results_dict_list:
             #print(trial_1.eval_results_dict_list)
-            category = eval_results_dict.split("_")[0]
-            res_dict = ast.literal_eval(eval_results_dict.split("_")[1])
             result = res_dict['MAE']
             example_dict = dict({i[:-4] + '_aggr': result})
-            model_mae_dict[( category, i[:-4] + '_aggr' )] = result
+            metrics_rows.append({'Model': category, 'Floor': i[:-4] + '_aggr', **res_dict})
     
             try :
                 MAE_dict[category].append(example_dict)
@@ -145,12 +209,12 @@ def Darts_Pipeline():
             #produce prediction results sheet
             if agg: sheet_name_tail = "aggr"
             else :  sheet_name_tail = ""
-            append_to_excel('Darts\output.xlsx', dataframe, i[:-4] + "-" + m + "-" + sheet_name_tail)
+            export.add_sheet(os.path.join('Darts', 'output.xlsx'), i[:-4] + "-" + m + "-" + sheet_name_tail, dataframe)
         
         forecasts_all_dict[i[:-4]] = prediction_dict
-        prediction_dict = {}
     
-    trial_1.plot_results('MAE', MAE_dict, Name = modelNameList)
+    with stage_metrics.stage('plot'):
+        trial_1.plot_results('MAE', MAE_dict, Name = modelNameList, plots = plots)
     print(forecasts_all_dict)
     
     """
@@ -158,21 +222,18 @@ def Darts_Pipeline():
     Generate MAE sheets
     ================
     """
-    m_dict = {}
-    
-    for m,f in model_mae_dict.keys():
-        m_dict[m] = pd.DataFrame(columns=['Floor', 'MAE'])
-    
-    for (m,f), v in model_mae_dict.items():
-        df = pd.DataFrame([[f,v]], columns=['Floor', 'MAE'])
-        #print(df)
-        tojoin = [m_dict[m], df]
-        m_dict[m] = pd.concat(tojoin)
-    #print(m_dict)
+    # one sheet per model: a row per floor, a column per metric
+    metrics_df = pd.DataFrame(metrics_rows)
+    #print(metrics_df)
     
-    for m,d in m_dict.items():
-        d = d.reset_index(drop=True)
-        append_to_excel('Darts\Performance Metric - MAE.xlsx', d, m)
+    for m,d in metrics_df.groupby('Model', sort=False):
+        d = d.drop(columns=['Model']).reset_index(drop=True)
+        export.add_sheet(os.path.join('Darts', 'Performance Metric - MAE.xlsx'), m, d)
+    with stage_metrics.stage('export'):
+        export.flush()
+    if own_plots:
+        with stage_metrics.stage('plot (wait)'):
+            plots.close()
 
     return MAE_dict, forecasts_all_dict
 
@@ -17,58 +17,65 @@ import pandas as pd
 import numpy as np
 import Darts.brock_comm_config as config
 import os
-from datetime import datetime as dt
-import logging
 from sklearn.impute import SimpleImputer
 from Darts.regressor_helper import RegressHelp
-import matplotlib.pyplot as plt
-from sklearn.metrics import mean_absolute_error
-class Darts_CLT_Perform:
+from ingest_helper import IngestHelp
+from batch_helper import BatchHelp
+from metrics_helper import stage_metrics
+from eval_helper import evaluate
+from log_helper import get_logger
+from plot_helper import PlotHelp
+from registry_helper import ModelRegistry
+from artifact_helper import library_versions
+from pandas.tseries.frequencies import to_offset
+from functools import partial
+import copy
+import backtest_helper
+
+
+def forecast_cutoff(cutoff, name, model, series, covariates, forecast_horizon):
+    """
+    one cutoff of a backtest (see backtest_helper.run_backtest): fits a copy of the (unfitted) model 'name' on the steps of 'series' before 'cutoff'
+    and returns the values of the forecast of the next forecast_horizon steps
+    """
+    p = Darts_CLT_Perform.fit_predict(name, copy.deepcopy(model), series[:cutoff], covariates, forecast_horizon)
+    return p.values()[:, 0]
+
+
+class Darts_CLT_Perform(BatchHelp):
     """
     This class conducts the time-series analysis for a SINGLE csv file
     """
-    def __init__(self, csv_file_name, agg):
-        self.eval_results_dict_list = []
-        # load datasheet
+    # registry 'file' of the global models (see save_model): the registry matches a None file as any file, so they need a name of their own
+    GLOBAL_FILE = '__global__'
+
+    def __init__(self, csv_file_name, agg, columns=None):
+        self.eval_results_dict_list = [] # [(model name, eval_results_dict)]
+        # load datasheet ('NULL' and white space are cleaned while parsing, see ingest_helper.py)
         sheet_path = os.path.sep.join([config.DATASHEETS_PATH, csv_file_name])
-        self.worksheet = pd.read_csv(sheet_path, index_col=False)
+        # the models of this file are saved under its name (see save_model)
+        self.file_name = csv_file_name
+        # keep the sheet as a compact Worksheet (see ingest_helper.py) of the modelled series only: the aggregate, or the columns asked for (all of them if None)
+        # in streaming mode (config.INGEST_STREAMING), the csv is read in chunks
+        self.worksheet = IngestHelp(cache_dir=config.INGEST_CACHE_PATH).load_worksheet(sheet_path, columns=[] if agg else columns, agg=agg, dtype=config.WORKSHEET_DTYPE,
+            streaming=config.INGEST_STREAMING, chunk_rows=config.INGEST_CHUNK_ROWS)
         """
         =================
         set up the logger
         =================
         """
-        # gets or creates a logger
-        self.logger = logging.getLogger(__name__)  
-        # set log level
-        self.logger.setLevel(logging.INFO)
-        # define file handler and set formatter
-        file_handler = logging.FileHandler('CLT_perform.log')
-        formatter = logging.Formatter('%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-        file_handler.setFormatter(formatter)
-        # add file handler to logger
-        self.logger.addHandler(file_handler)
+        # the logger shared by every instance: handlers are set up once per process, and one background thread writes config.LOG_PATH (see log_helper.py)
+        self.logger = get_logger(__name__, config.LOG_PATH, config.LOG_LEVEL)
         """
         =============
         data cleaning
         =============
         """
-        # - remove white space for column names
-        self.worksheet.columns = [x.strip() for x in list(self.worksheet.columns)]
-        # - remove white space for str objects in data columns & replace 'NULL' with 'None'
-        for col_name in self.worksheet.columns:
-            self.worksheet[col_name] = self.worksheet[col_name].apply(lambda x: x.strip() if isinstance(x, str) else x)
-            self.worksheet[col_name] = self.worksheet[col_name].apply(lambda x: np.nan if x == 'NULL' else x)
-        
-        # adding aggregate data column-------------feel free to modify to customize calculation
-        if agg == True:
-            self.worksheet['Aggregate'] = self.worksheet.iloc[:,1:].astype(float).mean(axis=1, skipna=True)
-            #print(self.worksheet)
-        # - create two new columns to store Date and Time separately
-        self.worksheet["DateTime"] = self.worksheet["DateTime"].apply(lambda x: dt.strptime(x[:-5], "%Y-%m-%d %H:%M:%S")) # slice to exclude timezone info
-        self.worksheet['Date'] = self.worksheet["DateTime"].apply(lambda x: x.date())
-        self.worksheet['Time'] = self.worksheet["DateTime"].apply(lambda x: x.time())
+        # aggregate data column (added by load_worksheet)-------------feel free to modify to customize calculation in Worksheet.from_frame
+        #print(self.worksheet)
+        # - Date and Time separately ('DateTime' is already parsed, timezone info excluded) are derived on first use: self.worksheet['Date'], self.worksheet['Time']
         # - get a list of data column names 
-        self.data_columns = [col_name for col_name in self.worksheet.columns if col_name not in ['Date', 'Time', 'DateTime']]
+        self.data_columns = list(self.worksheet.columns)
     
     def preprocess(self, col_name, in_sample_forecast=True, forecast_horizon=None, **kwargs):
         """
@@ -78,20 +85,22 @@ class Darts_CLT_Perform:
         """
         # store column name for plot use
         self.col_name = col_name
-        # get a list of timestamps where there is missing data
-        boolean_mask= pd.isna(self.worksheet[col_name])
-        missing_data_timestamps = list(self.worksheet['DateTime'][boolean_mask])
+        # gaps in the time grid of the series are imputed the same way (see make_series)
+        self.impute = kwargs.get('impute', 'mean')
+        # find the rows with missing data
+        y = self.worksheet.column(col_name)
+        boolean_mask= np.isnan(y)
+        valid_rows = np.flatnonzero(~boolean_mask)
+        first_valid_idx, last_valid_idx = (int(valid_rows[0]), int(valid_rows[-1])) if len(valid_rows) else (None, None)
         # log the information of the data
         self.logger.info(f"==== statistics of {col_name} column ====")
-        #self.logger.info(f"timestamps of missing data are {missing_data_timestamps}")
-        self.logger.info(f"idx of the FIRST valid cell is: {self.worksheet[col_name].first_valid_index()}")
-        self.logger.info(f"idx of the LAST valid cell is: {self.worksheet[col_name].last_valid_index()}")
+        self.logger.info(f"idx of the FIRST valid cell is: {first_valid_idx}")
+        self.logger.info(f"idx of the LAST valid cell is: {last_valid_idx}")
         self.logger.info(" ")
         # retain the time series data with valid data
-        # determine first and last valid index
-        first_valid_idx, last_valid_idx = self.worksheet[col_name].first_valid_index(), self.worksheet[col_name].last_valid_index()
-        # make a copy of the part of interest
-        self.data_for_anal = pd.DataFrame(self.worksheet[[col_name,"DateTime"]].iloc[first_valid_idx:last_valid_idx+1].copy()).rename(columns={col_name:'y', 'DateTime': 'ds'})
+        # make a copy of the part of interest (between the first and last valid index), indexed by worksheet row
+        self.data_for_anal = pd.DataFrame({'y': y[first_valid_idx:last_valid_idx+1].astype(float), 'ds': self.worksheet.index[first_valid_idx:last_valid_idx+1]},
+            index=pd.RangeIndex(first_valid_idx, last_valid_idx+1))
         #self.data_for_anal = pd.DataFrame(self.worksheet[col_name].iloc[first_valid_idx:last_valid_idx+1].copy()).rename(columns={col_name:'y'}) # [caution] .iloc is end-exclusive (while .loc is end-inclusive)
         #print(self.data_for_anal.tail())
         
@@ -106,13 +115,14 @@ class Darts_CLT_Perform:
             self.data_for_anal['y_imputed'] = y_imputed
             self.data_for_anal.drop(columns=['y'], inplace=True)
             self.data_for_anal.rename(columns={'y_imputed': 'y'}, inplace=True)
-            print(f"after imputation, there is {self.data_for_anal['y'].isna().sum()} missing pt")
+            self.logger.info(f"after imputation, there is {self.data_for_anal['y'].isna().sum()} missing pt")
             
         if 'regressor_list' in kwargs:
             reg_help = RegressHelp()
             for (regressor_name_lst, regressor_df) in kwargs['regressor_list']:
                 # match the timestep between regressor and time series; regressor_tuple([regressor_col_name1,...,regressor_col_nameN], regressor_dataframe)
-                adjusted_regr, self.data_for_anal = reg_help.matching_regr_data(regressor_df, self.data_for_anal)
+                with stage_metrics.stage('regressor alignment', rows=len(self.data_for_anal)):
+                    adjusted_regr, self.data_for_anal = reg_help.matching_regr_data(regressor_df, self.data_for_anal)
                 for regressor_name in regressor_name_lst:
                     # add regressor data to the timeseries dataframe
                     self.data_for_anal[regressor_name] = adjusted_regr[regressor_name].values
@@ -123,28 +133,192 @@ class Darts_CLT_Perform:
             self.test_df =  self.data_for_anal[-forecast_horizon:].copy()
         else:
             self.train_df = self.data_for_anal.copy()
-        print(self.train_df.tail())
-        
+        self.logger.debug(self.train_df.tail())
+
+    def preprocess_batch(self, col_names, in_sample_forecast=True, forecast_horizon=None, **kwargs):
+        """
+        see BatchHelp.preprocess_batch (batch_helper.py)
+        """
+        # gaps in the time grid of the series are imputed the same way (see make_series)
+        self.impute = kwargs.get('impute', 'mean')
+        super().preprocess_batch(col_names, in_sample_forecast, forecast_horizon, **kwargs)
+
+    @staticmethod
+    def detect_freq(ds):
+        """
+        sampling frequency of a 'ds' column, e.g. '2H': the most common step between consecutive timestamps
+        (pd.infer_freq gives up on any gap or DST shift, which every sensor export has)
+        """
+        steps = np.diff(pd.DatetimeIndex(ds).values)
+        steps = steps[steps > np.timedelta64(0)]
+        values, counts = np.unique(steps, return_counts=True)
+        return to_offset(pd.Timedelta(values[counts.argmax()])).freqstr
+
+    def make_series(self, df, value_cols, freq=None):
+        """
+        build a TimeSeries of df[value_cols] at the sampling frequency of df['ds'] (detected if freq is None):
+            - timestamps are floored onto the frequency grid, so series and covariates share one grid
+              (the exports are in local time, DST moves their readings by an hour; the last reading of a grid step is kept)
+            - grid steps without any reading are imputed with the strategy of preprocess (self.impute, 'mean' if not preprocessed)
+        """
+        if freq is None:
+            freq = self.detect_freq(df['ds'])
+        grid_df = df[value_cols].set_axis(pd.DatetimeIndex(df['ds']).floor(freq), axis=0)
+        grid_df = grid_df[~grid_df.index.duplicated(keep='last')]
+        grid_df = grid_df.reindex(pd.date_range(grid_df.index[0], grid_df.index[-1], freq=freq))
+        if grid_df.isna().values.any():
+            my_imputer = SimpleImputer(strategy=getattr(self, 'impute', 'mean'))
+            grid_df[value_cols] = my_imputer.fit_transform(grid_df[value_cols].values)
+        return TimeSeries.from_dataframe(grid_df.rename_axis('ds').reset_index(), 'ds', value_cols, freq=freq)
+
     def train_forecast_eval(self, train, covariates, forecast_horizon, **kwargs):
         # print("covariates:", covariates)
         name = kwargs['Name']
         m = kwargs['model']
-        series = TimeSeries.from_dataframe(train, 'ds','y', fill_missing_dates=True, freq='H',fillna_value=0)
+        series = self.make_series(train, ['y'])
         # print("series:", series)
+        p = self.fit_predict(name, m, series, covariates, forecast_horizon)
+        #print(p)
+        self.collect_forecast(name, p, forecast_horizon, **kwargs)
+
+    @staticmethod
+    def fit_predict(name, m, series, covariates, forecast_horizon):
+        """
+        fit the model 'name' on ONE series and forecast forecast_horizon steps; returns the series itself for an unknown model name
+        """
         p = series
         if name == "ARIMA": 
             m.fit(series, covariates)
-            p = m.predict(forecast_horizon, covariates)
+            p = Darts_CLT_Perform.predict(name, m, covariates, forecast_horizon)
         if name == "RegressionModel" or name == "LightGBMModel": 
-            m.fit(series, None, covariates)
-            p = m.predict(forecast_horizon, None, None, covariates)
-        #print(p)
+            fit_kwargs = Darts_CLT_Perform.design_matrix_budget(name, Darts_CLT_Perform.model_lags(name, forecast_horizon), [len(series)], covariates.n_components)
+            m.fit(series, None, covariates, **fit_kwargs)
+            p = Darts_CLT_Perform.predict(name, m, covariates, forecast_horizon)
+        return p
+
+    @staticmethod
+    def predict(name, m, covariates, forecast_horizon):
+        """
+        forecast forecast_horizon steps past the end of the series the fitted model 'name' was trained on (e.g. a model of the model registry)
+        """
+        if name == "ARIMA":
+            return m.predict(forecast_horizon, covariates)
+        return m.predict(forecast_horizon, None, None, covariates)
+
+    def backtest(self, name, model, covariates, initial=None, period=None, horizon=None, n_jobs=None):
+        """
+        rolling-origin backtest (see backtest_helper.py) of the model 'name' on the column prepared by preprocess or select_column
+        the series is built on its frequency grid once (make_series), every cutoff only slices it
+            - model: an unfitted model, each cutoff fits its own copy
+            - covariates: the covariate TimeSeries, as given to train_forecast_eval
+            - initial, period, horizon: in steps, default to config.BACKTEST_INITIAL, config.BACKTEST_PERIOD, config.BACKTEST_HORIZON
+            - n_jobs: number of worker processes fitting the cutoffs, defaults to config.BACKTEST_N_JOBS (None = all cores, 1 = serial)
+        Returns:
+            - self.backtest_results: a df('cutoff', 'step', 'ds', 'y', 'yhat', 'error'), one row per cutoff and horizon step
+        """
+        initial = config.BACKTEST_INITIAL if initial is None else initial
+        period = config.BACKTEST_PERIOD if period is None else period
+        horizon = config.BACKTEST_HORIZON if horizon is None else horizon
+        n_jobs = config.BACKTEST_N_JOBS if n_jobs is None else n_jobs
+
+        series = self.make_series(self.data_for_anal, ['y'])
+        actual = series.pd_dataframe()
+        cutoffs = backtest_helper.rolling_origin_cutoffs(len(actual), initial, period, horizon)
+        self.logger.info(f"backtest of {name} on {self.col_name}: {len(cutoffs)} cutoffs")
+
+        forecast = partial(forecast_cutoff, name=name, model=model, series=series, covariates=covariates, forecast_horizon=horizon)
+        self.backtest_results = backtest_helper.run_backtest(forecast, actual.index, actual['y'], cutoffs, horizon, n_jobs)
+        return self.backtest_results
+
+    @staticmethod
+    def save_model(m, name, file_name=None, col_name=None):
+        """
+        save the fitted model 'name' to the model registry in config.MODEL_REGISTRY_PATH (see registry_helper.py), under its sensor file, column and parameters
+        global models (see fit_predict_global) are saved without file and column, under the file GLOBAL_FILE
+        """
+        params = m.model_params if hasattr(m, 'model_params') else config.MODEL_LAGS.get(name, {})
+        if file_name is None:
+            file_name = Darts_CLT_Perform.GLOBAL_FILE
+        ModelRegistry(config.MODEL_REGISTRY_PATH).save(m, file_name, col_name, name, params, name=name, versions=library_versions('darts', 'lightgbm', 'scikit-learn'))
+
+    @staticmethod
+    def load_model(name, file_name=None, col_name=None):
+        """
+        the model 'name' of a sensor file and column (or the global one, if file_name is None) saved most recently to the model registry, or None;
+        only that model is read
+        """
+        if file_name is None:
+            file_name = Darts_CLT_Perform.GLOBAL_FILE
+        return ModelRegistry(config.MODEL_REGISTRY_PATH).get(file=file_name, column=col_name, model_type=name)
+
+    @staticmethod
+    def fit_predict_global(name, m, series_list, covariates, forecast_horizon):
+        """
+        fit ONE regression model (RegressionModel, LightGBMModel) on the series of several columns/files, sharing the covariates,
+        then forecast all of them in a single predict call; returns the forecasts in the order of series_list
+        """
+        covariates_list = [covariates] * len(series_list)
+        fit_kwargs = Darts_CLT_Perform.design_matrix_budget(name, Darts_CLT_Perform.model_lags(name, forecast_horizon), [len(series) for series in series_list], covariates.n_components)
+        m.fit(series_list, None, covariates_list, **fit_kwargs)
+        return m.predict(forecast_horizon, series_list, None, covariates_list)
+
+    @staticmethod
+    def model_lags(name, forecast_horizon):
+        """
+        the lag arguments of the regression model 'name' (config.MODEL_LAGS) for a forecast of forecast_horizon steps:
+        'horizon' becomes range(-(forecast_horizon-1), 1), the covariate steps of the whole horizon
+        """
+        return {arg: list(range(-(forecast_horizon - 1), 1)) if lags == 'horizon' else lags for (arg, lags) in config.MODEL_LAGS[name].items()}
+
+    @staticmethod
+    def count_lags(lags):
+        """
+        returns (number of lags, number of steps looked back) of a Darts lag argument: None, n (the last n steps), (n_past, n_future) or a list of lags
+        """
+        if lags is None:
+            return 0, 0
+        if isinstance(lags, int):
+            return lags, lags
+        if isinstance(lags, tuple):
+            return lags[0] + lags[1], lags[0]
+        return len(lags), max(0, -min(lags))
+
+    @staticmethod
+    def design_matrix_budget(name, model_lags, series_lengths, n_covariates, output_chunk_length=1):
+        """
+        estimate the lagged design matrix of a regression model before it is fitted, and keep it within config.DESIGN_MATRIX_BUDGET_MB:
+            - one row per predictable step of every series, one column per target lag and per covariate lag of every covariate
+            - returns the extra fit arguments: {} within the budget, max_samples_per_ts (the most recent rows of every series) above it
+        raises an error instead of downsampling if config.DESIGN_MATRIX_OVERBUDGET is 'refuse'
+        """
+        n_target_lags, target_lookback = Darts_CLT_Perform.count_lags(model_lags.get('lags'))
+        n_future_lags, future_lookback = Darts_CLT_Perform.count_lags(model_lags.get('lags_future_covariates'))
+        lookback = max(target_lookback, future_lookback)
+        n_rows = [max(0, length - lookback - output_chunk_length + 1) for length in series_lengths]
+        n_cols = n_target_lags * output_chunk_length + n_future_lags * n_covariates
+        matrix_mb = sum(n_rows) * n_cols * 8 / 2**20
+        logger = get_logger(__name__, config.LOG_PATH, config.LOG_LEVEL)
+        logger.info(f"{name} design matrix: {sum(n_rows)} rows x {n_cols} columns = {matrix_mb:.0f} MB")
+        if matrix_mb <= config.DESIGN_MATRIX_BUDGET_MB:
+            return {}
+
+        if config.DESIGN_MATRIX_OVERBUDGET == 'refuse':
+            raise ValueError(f"{name} design matrix ({matrix_mb:.0f} MB) is above the budget of {config.DESIGN_MATRIX_BUDGET_MB} MB, use sparser lags in config.MODEL_LAGS")
+        max_samples_per_ts = max(1, int(config.DESIGN_MATRIX_BUDGET_MB * 2**20 / (n_cols * 8)) // len(series_lengths))
+        logger.warning(f"{name} design matrix ({matrix_mb:.0f} MB) is above the budget of {config.DESIGN_MATRIX_BUDGET_MB} MB, fitting on the last {max_samples_per_ts} rows of every series")
+        return {'max_samples_per_ts': max_samples_per_ts}
+
+    def collect_forecast(self, name, p, forecast_horizon, **kwargs):
+        """
+        store the forecast TimeSeries p of model 'name' as self.forecast_results and evaluate it against kwargs['groundtruth']
+        """
         self.forecast_results = p.pd_dataframe().rename_axis('ds').reset_index()
-        print(self.forecast_results)
+        self.logger.debug(self.forecast_results)
         
         if 'groundtruth' in kwargs:
-            self.eval_results_dict = self.eval_model(kwargs['groundtruth'], self.forecast_results, forecast_horizon)
-            self.eval_results_dict_list.append(name + "_" + str(self.eval_results_dict))
+            with stage_metrics.stage('evaluate', rows=len(kwargs['groundtruth'])):
+                self.eval_results_dict = self.eval_model(kwargs['groundtruth'], self.forecast_results, forecast_horizon)
+            self.eval_results_dict_list.append((name, self.eval_results_dict))
             # log the evaluation results
             for method, result in self.eval_results_dict.items():
                 self.logger.info(f"{method}: {result}")                    
@@ -157,13 +331,22 @@ class Darts_CLT_Perform:
         """
         #print(f"groundtruth shape is {groundtruth['y'].shape}")
         #print(f"forecast_results is {forecast_results['yhat'].shape}")
-        return {'MAE': mean_absolute_error(groundtruth['y'], forecast_results['y'][-forecast_horizon:])}    
+        # the forecast is on the frequency grid of make_series: floor the groundtruth onto the same grid and pair the rows by timestamp,
+        # so gaps or duplicate timestamps in the test window do not shift the pairs (grid steps without a reading are NaN, left out of the metrics)
+        forecast = forecast_results.iloc[-forecast_horizon:]
+        freq = self.detect_freq(forecast['ds']) if len(forecast) > 1 else self.detect_freq(groundtruth['ds'])
+        truth = pd.Series(groundtruth['y'].values, index=pd.DatetimeIndex(groundtruth['ds']).floor(freq))
+        truth = truth[~truth.index.duplicated(keep='last')].reindex(pd.DatetimeIndex(forecast['ds']))
+        # point forecasts only, so 'Coverage' is NaN
+        return evaluate(truth.values, forecast['y'].values).iloc[0].to_dict()
     
     def plot_results(self, fig_name, MAE_dict, **kwargs):
         """
-        use the built-in plotting method to plot the forecast results, see: https://unit8co.github.io/darts/generated_api/darts.timeseries.html#darts.timeseries.TimeSeries.plot
+        plot the MAE of every model per floor
+            - plots (optional kwarg): a PlotHelp rendering in the background; without it, the figure is rendered before returning
         """
-        plt.figure(figsize=(10, 8))
+        plots = kwargs['plots'] if 'plots' in kwargs else PlotHelp(config.PLOTS, config.PLOT_DPI, config.PLOT_FORMAT, config.PLOT_MAX_POINTS, n_workers=0)
+        lines = []
         for mae in MAE_dict:               
             MAE_floor_list = []
             MAE_value_list = []
@@ -173,10 +356,6 @@ class Darts_CLT_Perform:
                 MAE_floor_list.append(floor)
                 MAE_value_list.append(val)
             
-            plt.plot(MAE_floor_list, MAE_value_list,label=mae)
+            lines.append((mae, MAE_floor_list, MAE_value_list))
             
-        plt.xlabel("floor")
-        plt.ylabel("MAE")
-        plt.legend(loc='best')
-        plt.savefig(os.path.sep.join([config.OUTPUT_PATH,'{}.png'.format(fig_name)]), dpi=600)
-        plt.show()
\ No newline at end of file
+        plots.line_plot(config.OUTPUT_PATH, fig_name, lines, "floor", "MAE")
\ No newline at end of file
@@ -1,6 +1,10 @@
 """
 This config file stores 
 """
+import os
+
+# settings shared with the Prophet pipeline (caches, logging, backtests, figures)
+from shared_config import *
 
 # path to datasheets
 DATASHEETS_PATH = 'TALLWOOD DATA'
@@ -9,5 +13,28 @@ DATASHEETS_PATH = 'TALLWOOD DATA'
 CLIMATE_DATA_PATH = 'climate_data'
 
 # path to output files
-OUTPUT_PATH = 'Darts\output'
+OUTPUT_PATH = os.path.join('Darts', 'output')
+
+# path to the model registry: every fitted model, per sensor file, column and parameters (see registry_helper.py)
+MODEL_REGISTRY_PATH = os.path.join(OUTPUT_PATH, 'models')
+
+# models of Darts_Pipeline, in the order they are run
+MODEL_NAMES = ['ARIMA', 'RegressionModel', 'LightGBMModel']
+
+# fit the models of GLOBAL_MODEL_NAMES once on the series of every file (and column), with the shared climate covariates,
+# instead of once per series; ARIMA is a local model and is always fitted per series
+GLOBAL_MODEL = False
+GLOBAL_MODEL_NAMES = ['RegressionModel', 'LightGBMModel']
 
+# lags of the Darts regression models, per model name, in any form Darts accepts: None, n (the last n steps) or a list of lags,
+# so sparse and seasonal lags can be listed directly, e.g. 'lags': [*range(-12, 0), -84, -168] (84 steps = a week of 2-hour readings)
+# the climate regressors are passed as future covariates, so only 'lags' and 'lags_future_covariates' are used;
+# 'horizon' stands for the lags of the forecast horizon of the run, range(-(forecast_horizon-1), 1) (see Darts_CLT_Perform.model_lags)
+MODEL_LAGS = {
+    'RegressionModel': {'lags': None, 'lags_future_covariates': 'horizon'},
+    'LightGBMModel': {'lags': None, 'lags_future_covariates': 'horizon'},
+}
+# the lagged design matrix (float64) a regression model is fitted on is estimated before fitting; above DESIGN_MATRIX_BUDGET_MB,
+# 'downsample' fits on the most recent rows of every series only (max_samples_per_ts), 'refuse' raises an error
+DESIGN_MATRIX_BUDGET_MB = 1024
+DESIGN_MATRIX_OVERBUDGET = 'downsample'
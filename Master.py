@@ -1,31 +1,189 @@
 """
 This script ties all the data cleaning, training, forecasting, results collection and results analysis from all models
+    python Master.py                        # Prophet on the aggregate of every sensor file, as before
+    python Master.py --pipelines prophet darts --files "String Pots.csv" --horizon 150 --grid small --no-plots
+    python Master.py --mode columns --columns "5-6 Floor String Pot (8917/18)" --dry-run
+With --dry-run, nothing is trained: the number of fits of the run is printed, with a runtime estimated from the
+run metrics reports of past runs (output/run_metrics_*.json, see metrics_helper.py)
 Author: Leo Sun, Manqin Cai
 """
-# import the pipelines 
-from Darts.Final_Pipeline import Darts_Pipeline
-from Prophet.prediction import Prophet_Pipeline
-from Results_Analysis import Results_Analysis
-
-# run the pipelines and get the MAE and forecast results
-MAE_df, forecast_dict, groundtruth_dict = Prophet_Pipeline()
-#MAE_dict, forecasts_all_dict = Darts_Pipeline()
-
-#print(MAE_dict)
-#print(forecasts_all_dict)
-#print(MAE_df)
-#print(forecast_dict)
-#print(groundtruth_dict)
-'''
-# do overall Darts and Prophet results analysis and plotting
-RA = Results_Analysis(MAE_dict = MAE_dict, forecasts_all_dict = forecasts_all_dict,
-                      MAE_df = MAE_df, forecast_dict = forecast_dict, groundtruth_dict = groundtruth_dict
-                      )  
-RA.MAE_Line_Plot(output_path='output')
-RA.Forecasts_Line_Plot(output_path='output')
-
-'''
-
-# do Prophet results analysis and plotting --- only for a clear visualization
-RA_Prophet = Results_Analysis(MAE_df = MAE_df, forecast_dict = forecast_dict, groundtruth_dict = groundtruth_dict)
-RA_Prophet.Forecasts_Line_Plot(output_path = 'Prophet\output')
+import argparse
+import datetime
+import os
+
+from sklearn.model_selection import ParameterGrid
+
+import Prophet.brock_comm_config as config
+import Darts.brock_comm_config as darts_config
+from Prophet.fb_prophet_train_forecast import FB_prophet_train_forecast
+from ingest_helper import IngestHelp
+from metrics_helper import stage_metrics, load_reports, stage_costs
+from plot_helper import PlotHelp
+
+SENSOR_DATA_PATH = 'TALLWOOD DATA/BCTW Sensor Data'
+REPORT_PATTERN = os.path.sep.join(['output', 'run_metrics_*.json'])
+# number of past reports the runtime is estimated from
+N_REPORTS = 5
+# stages run once per sensor file, without rows recorded
+FILE_STAGES = ['regressors', 'plot', 'save model']
+
+
+def plan_series(files, agg, columns):
+    """
+    the series each sensor file will be forecast on, read from the header of the sheets only: {file: (number of rows, [column names])}
+    files without any of the selected columns are left out
+    """
+    plan = {}
+    ingest = IngestHelp()
+    for i in files:
+        sheet_columns, n_rows = ingest.sheet_shape(os.path.sep.join([config.DATASHEETS_PATH, i]))
+        nameList = ['Aggregate'] if agg else [columnName for columnName in sheet_columns[1:] if columns is None or columnName in columns]
+        if nameList:
+            plan[i] = (n_rows, nameList)
+        else:
+            print(f"{i}: none of the selected columns, skipped")
+    return plan
+
+
+def uses_global_model(name):
+    return darts_config.GLOBAL_MODEL and name in darts_config.GLOBAL_MODEL_NAMES
+
+
+def plan_stages(args, series):
+    """
+    the work of the run, as (stage, count, rows per count) tuples named after the stages recorded by the pipelines (see metrics_helper.py)
+    """
+    stages = []
+    for pipeline in args.pipelines:
+        for i, (n_rows, nameList) in series.items():
+            train_rows = max(n_rows - args.horizon, 0)
+            stages += [('ingest', 1, n_rows), ('preprocess', 1, n_rows * len(nameList))] + [(stage, 1, None) for stage in FILE_STAGES]
+            if pipeline == 'prophet':
+                n_candidates = len(ParameterGrid(config.PARAM_GRIDS[args.grid]))
+                for n_fits, rows in FB_prophet_train_forecast.search_plan(n_candidates, train_rows, args.search):
+                    stages += [('prophet fit', n_fits * len(nameList), rows), ('prophet predict', n_fits * len(nameList), rows + args.horizon)]
+            else:
+                stages += [(name + ' fit/predict', len(nameList), train_rows) for name in args.models if not uses_global_model(name)]
+        if pipeline == 'darts':
+            all_rows = sum(max(n_rows - args.horizon, 0) * len(nameList) for (n_rows, nameList) in series.values())
+            stages += [(name + ' global fit/predict', 1, all_rows) for name in args.models if uses_global_model(name)]
+    return stages
+
+
+def estimate_runtime(stages, costs, parallel_fits):
+    """
+    Returns:
+        - the estimated seconds of the run (stages without a past record are left out), and the names of those stages
+    Prophet fits of the same file run on up to 'parallel_fits' processes at once
+    """
+    seconds, missing = 0.0, []
+    for stage, count, rows in stages:
+        if rows is not None and stage in costs['per_row']:
+            stage_seconds = count * rows * costs['per_row'][stage]
+        elif stage in costs['per_call']:
+            stage_seconds = count * costs['per_call'][stage]
+        else:
+            missing.append(stage)
+            continue
+        seconds += stage_seconds / parallel_fits if stage.startswith('prophet') else stage_seconds
+    return seconds, sorted(set(missing))
+
+
+def dry_run(args, series):
+    for pipeline in args.pipelines:
+        print(f"{pipeline}: {len(series)} file(s), {sum(len(nameList) for (_, nameList) in series.values())} series")
+    stages = plan_stages(args, series)
+    n_fits = sum(count for (stage, count, _) in stages if stage.endswith('fit') or stage.endswith('fit/predict'))
+    print(f"{n_fits} fits in total (grid '{args.grid}' with the '{args.search}' search for Prophet, horizon {args.horizon})")
+    for stage, count, rows in stages:
+        if stage.endswith('fit') or stage.endswith('fit/predict'):
+            print(f"    {stage:<36} {count:5d} x {rows} rows")
+
+    records = load_reports(REPORT_PATTERN, N_REPORTS)
+    if records.empty:
+        print(f"Estimated runtime: unknown, no run metrics report matches {REPORT_PATTERN} yet (a run without --dry-run writes one)")
+        return
+    # grid candidates of a file are scored on GRID_N_JOBS processes, files on n_workers processes
+    cores = os.cpu_count() or 1
+    n_workers = args.workers or config.N_WORKERS
+    grid_n_jobs = args.grid_jobs or config.GRID_N_JOBS or cores
+    seconds, missing = estimate_runtime(stages, stage_costs(records), max(1, min(cores, n_workers * grid_n_jobs)))
+    print(f"Estimated runtime: ~{datetime.timedelta(seconds=round(seconds))} (from the last {N_REPORTS} reports matching {REPORT_PATTERN})")
+    if missing:
+        print(f"    not included, no past record of: {missing}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train, forecast and evaluate the Prophet and/or Darts models on the Brock Commons sensor data')
+    parser.add_argument('--pipelines', nargs='+', choices=['prophet', 'darts'], default=['prophet'])
+    parser.add_argument('--files', nargs='+', help=f"sensor files to forecast (default: every file in '{SENSOR_DATA_PATH}')")
+    parser.add_argument('--mode', choices=['aggregate', 'columns'], default='aggregate', help='forecast the mean of the sensor columns of each file, or the columns one by one')
+    parser.add_argument('--columns', nargs='+', help='sensor columns to forecast with --mode columns (default: all of them)')
+    parser.add_argument('--models', nargs='+', choices=darts_config.MODEL_NAMES, default=darts_config.MODEL_NAMES, help='Darts models to run')
+    parser.add_argument('--horizon', type=int, default=300, help='forecast horizon, in 2-hour steps (300 = 600 hr)')
+    parser.add_argument('--grid', choices=list(config.PARAM_GRIDS), default=config.PARAM_GRID, help='Prophet hyperparameter grid')
+    parser.add_argument('--search', choices=list(FB_prophet_train_forecast.SEARCH_STRATEGIES), default=config.SEARCH_STRATEGY, help='Prophet hyperparameter search strategy')
+    parser.add_argument('--workers', type=int, help=f"processes forecasting Prophet files in parallel (default: {config.N_WORKERS})")
+    parser.add_argument('--grid-jobs', type=int, help='processes scoring the Prophet grid of each file (default: config.GRID_N_JOBS)')
+    parser.add_argument('--no-plots', action='store_true', help='skip every figure')
+    parser.add_argument('--dry-run', action='store_true', help='print the number of fits and an estimated runtime, without running')
+    args = parser.parse_args()
+    if args.columns and args.mode == 'aggregate':
+        parser.error('--columns needs --mode columns')
+    return args
+
+
+# the guard is needed for the process pool used by the pipelines (worker processes re-import this script on Windows)
+if __name__ == '__main__':
+    args = parse_args()
+    agg = args.mode == 'aggregate'
+    files = args.files if args.files is not None else sorted(os.listdir(SENSOR_DATA_PATH))
+    series = plan_series(files, agg, args.columns)
+    if args.dry_run:
+        dry_run(args, series)
+        raise SystemExit
+
+    # every figure of the run is rendered in the background, while the pipelines go on
+    plots = PlotHelp(config.PLOTS and not args.no_plots, config.PLOT_DPI, config.PLOT_FORMAT, config.PLOT_MAX_POINTS, config.PLOT_WORKERS)
+
+    # run the pipelines and get the MAE and forecast results (the pipelines are imported only if selected, e.g. Darts may not be installed)
+    if 'prophet' in args.pipelines:
+        from Prophet.prediction import Prophet_Pipeline
+        with stage_metrics.stage('Prophet_Pipeline'):
+            MAE_df, forecast_dict, groundtruth_dict = Prophet_Pipeline(
+                n_workers=args.workers, plots=plots, files=list(series), columns=args.columns, agg=agg, forecast_horizon=args.horizon,
+                grid_n_jobs=args.grid_jobs, search_kwargs={'param_grid': config.PARAM_GRIDS[args.grid], 'search_strategy': args.search})
+    if 'darts' in args.pipelines:
+        from Darts.Final_Pipeline import Darts_Pipeline
+        with stage_metrics.stage('Darts_Pipeline'):
+            MAE_dict, forecasts_all_dict = Darts_Pipeline(plots=plots, files=list(series), columns=args.columns, models=args.models, agg=agg, forecast_horizon=args.horizon)
+
+    #print(MAE_dict)
+    #print(forecasts_all_dict)
+    #print(MAE_df)
+    #print(forecast_dict)
+    #print(groundtruth_dict)
+    '''
+    # do overall Darts and Prophet results analysis and plotting
+    RA = Results_Analysis(MAE_dict = MAE_dict, forecasts_all_dict = forecasts_all_dict,
+                          MAE_df = MAE_df, forecast_dict = forecast_dict, groundtruth_dict = groundtruth_dict, plots = plots
+                          )
+    RA.MAE_Line_Plot(output_path='output')
+    RA.Forecasts_Line_Plot(output_path='output')
+
+    '''
+
+    # do Prophet results analysis and plotting --- only for a clear visualization
+    if 'prophet' in args.pipelines:
+        from Results_Analysis import Results_Analysis
+        with stage_metrics.stage('Results_Analysis'):
+            RA_Prophet = Results_Analysis(MAE_df = MAE_df, forecast_dict = forecast_dict, groundtruth_dict = groundtruth_dict, plots = plots)
+            RA_Prophet.Forecasts_Line_Plot(output_path = config.OUTPUT_PATH)
+
+    # wait for the figures still being rendered
+    with stage_metrics.stage('plot (wait)'):
+        plots.close()
+
+    # where the running time went: one record per stage (and series) in output/run_metrics_<time>.json/.csv
+    stage_metrics.write_report(os.path.sep.join(['output', f"run_metrics_{datetime.datetime.now():%Y%m%d-%H%M%S}"]))
+    print(stage_metrics.summary())
@@ -19,71 +19,64 @@ Import libraries
 #import pmdarima as pm
 import pandas as pd
 import numpy as np
+import hashlib
 import Prophet.brock_comm_config as config
 import os
-from datetime import datetime as dt
-import logging
-from Prophet.fb_prophet_train_forecast import FB_prophet_train_forecast
+from Prophet.fb_prophet_train_forecast import FB_prophet_train_forecast, model_init_params, model_hyperparams, model_history, fit_predict, forecast_cutoff
+from functools import partial
+import backtest_helper
+from sklearn.metrics import mean_absolute_error
 from sklearn.impute import SimpleImputer
 import json
-from prophet.serialize import model_to_json, model_from_json
+from prophet.serialize import model_from_json
 from Prophet.regressor_helper import RegressHelp
+from ingest_helper import IngestHelp
+from batch_helper import BatchHelp
+from metrics_helper import stage_metrics
+from log_helper import get_logger
+from plot_helper import PlotHelp
+from registry_helper import ModelRegistry
+from artifact_helper import library_versions
 
 
-class CLT_perform:
+class CLT_perform(BatchHelp):
 	"""
 	This class conducts the time-series analysis for a SINGLE csv file
 	"""
 
-	def __init__(self, csv_file_name, agg):
-		# load datasheet
+	def __init__(self, csv_file_name, agg, columns=None):
+		# load datasheet ('NULL' and white space are cleaned while parsing, see ingest_helper.py)
 		sheet_path = os.path.sep.join([config.DATASHEETS_PATH, csv_file_name])
-		self.worksheet = pd.read_csv(sheet_path, index_col=False)
+		# the models of this file are saved under its name (see save_model)
+		self.file_name = csv_file_name
+		# keep the sheet as a compact Worksheet (see ingest_helper.py) of the modelled series only: the aggregate, or the columns asked for (all of them if None)
+		# in streaming mode (config.INGEST_STREAMING), the csv is read in chunks
+		self.worksheet = IngestHelp(cache_dir=config.INGEST_CACHE_PATH).load_worksheet(sheet_path, columns=[] if agg else columns, agg=agg, dtype=config.WORKSHEET_DTYPE,
+			streaming=config.INGEST_STREAMING, chunk_rows=config.INGEST_CHUNK_ROWS)
+		self.agg = agg
 
 		"""
 		=================
 		set up the logger
 		=================
 		"""
-		# gets or creates a logger
-		self.logger = logging.getLogger(__name__)  
-
-		# set log level
-		self.logger.setLevel(logging.INFO)
-
-		# define file handler and set formatter
-		file_handler = logging.FileHandler('CLT_perform.log')
-		formatter = logging.Formatter('%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-		file_handler.setFormatter(formatter)
-
-		# add file handler to logger
-		self.logger.addHandler(file_handler)
+		# the logger shared by every instance: handlers are set up once per process, and one background thread writes config.LOG_PATH (see log_helper.py)
+		self.logger = get_logger(__name__, config.LOG_PATH, config.LOG_LEVEL)
 
 		"""
 		=============
 		data cleaning
 		=============
 		"""
-		# - remove white space for column names
-		self.worksheet.columns = [x.strip() for x in list(self.worksheet.columns)]
-		# - remove white space for str objects in data columns & replace 'NULL' with 'None'
-		for col_name in self.worksheet.columns:
-			self.worksheet[col_name] = self.worksheet[col_name].apply(lambda x: x.strip() if isinstance(x, str) else x)
-			self.worksheet[col_name] = self.worksheet[col_name].apply(lambda x: np.nan if x == 'NULL' else x)
-		
 		# print(type(self.worksheet.at[16796, '5-6 Floor String Pot (8917/18)']))
 		# print(self.worksheet.at[16796, '5-6 Floor String Pot (8917/18)'])
-		# adding aggregate data column-------------feel free to modify to customize calculation
+		# aggregate data column (added by load_worksheet)-------------feel free to modify to customize calculation in Worksheet.from_frame
 		if agg == True:
-			self.worksheet['Aggregate'] = self.worksheet.iloc[:,1:].astype(float).mean(axis=1, skipna=True)
-			print(self.worksheet)
+			self.logger.debug(self.worksheet)
 
-		# - create two new columns to store Date and Time separately
-		self.worksheet["DateTime"] = self.worksheet["DateTime"].apply(lambda x: dt.strptime(x[:-5], "%Y-%m-%d %H:%M:%S")) # slice to exclude timezone info
-		self.worksheet['Date'] = self.worksheet["DateTime"].apply(lambda x: x.date())
-		self.worksheet['Time'] = self.worksheet["DateTime"].apply(lambda x: x.time())
+		# - Date and Time separately ('DateTime' is already parsed, timezone info excluded) are derived on first use: self.worksheet['Date'], self.worksheet['Time']
 		# - get a list of data column names 
-		self.data_columns = [col_name for col_name in self.worksheet.columns if col_name not in ['Date', 'Time', 'DateTime']]
+		self.data_columns = list(self.worksheet.columns)
 
 
 	def preprocess(self, col_name, in_sample_forecast=True, forecast_horizon=None, **kwargs):
@@ -95,37 +88,38 @@ class CLT_perform:
 		# store column name for plot use
 		self.col_name = col_name
 
-		# get a list of timestamps where there is missing data
-		boolean_mask= pd.isna(self.worksheet[col_name])
-		missing_data_timestamps = list(self.worksheet['DateTime'][boolean_mask])
+		# find the rows with missing data
+		y = self.worksheet.column(col_name)
+		boolean_mask= np.isnan(y)
+		valid_rows = np.flatnonzero(~boolean_mask)
+		first_valid_idx, last_valid_idx = (int(valid_rows[0]), int(valid_rows[-1])) if len(valid_rows) else (None, None)
 
 		# log the information of the data
 		self.logger.info(f"==== statistics of {col_name} column ====")
-		#self.logger.info(f"timestamps of missing data are {missing_data_timestamps}")
-		self.logger.info(f"idx of the FIRST valid cell is: {self.worksheet[col_name].first_valid_index()}")
-		self.logger.info(f"idx of the LAST valid cell is: {self.worksheet[col_name].last_valid_index()}")
+		self.logger.info(f"idx of the FIRST valid cell is: {first_valid_idx}")
+		self.logger.info(f"idx of the LAST valid cell is: {last_valid_idx}")
 		self.logger.info(" ")
 
 		# retain the time series data with valid data
-		# determine first and last valid index
-		first_valid_idx, last_valid_idx = self.worksheet[col_name].first_valid_index(), self.worksheet[col_name].last_valid_index()
-		# make a copy of the part of interest
-		self.data_for_anal = pd.DataFrame(self.worksheet[[col_name,"DateTime"]].iloc[first_valid_idx:last_valid_idx+1].copy()).rename(columns={col_name:'y', 'DateTime': 'ds'})
+		# make a copy of the part of interest (between the first and last valid index), indexed by worksheet row
+		self.data_for_anal = pd.DataFrame({'y': y[first_valid_idx:last_valid_idx+1].astype(float), 'ds': self.worksheet.index[first_valid_idx:last_valid_idx+1]},
+			index=pd.RangeIndex(first_valid_idx, last_valid_idx+1))
 		#self.data_for_anal = pd.DataFrame(self.worksheet[col_name].iloc[first_valid_idx:last_valid_idx+1].copy()).rename(columns={col_name:'y'}) # [caution] .iloc is end-exclusive (while .loc is end-inclusive)
 		#print(self.data_for_anal.tail())
 		# if needed, further refine the selection of time period
 		if 'drying_period' in kwargs: # if make prediction for drying period only, expecting a tuple of datatime obj: (start_dt, end_dt)
 			# e.g., ('2016-04-30 23:00:00-0700', '2016-05-01 11:00:00-0700')
 			# look up the corresponding idx using the 'drying_period'
-			drying_start_idx = self.worksheet.query("col_name == kwargs['drying_period'][0]").index[0]
-			drying_end_idx = self.worksheet.query("col_name == kwargs['drying_period'][1]").index[0]
+			# (timezone info is dropped, as it is from 'DateTime')
+			drying_start_idx = self.worksheet.index.get_loc(pd.Timestamp(kwargs['drying_period'][0]).tz_localize(None))
+			drying_end_idx = self.worksheet.index.get_loc(pd.Timestamp(kwargs['drying_period'][1]).tz_localize(None))
 			pass
 			# check if drying period idx are within the valid time period idx (compare with first and last valid indx)
 			#  if not, send the warning msg "Training for drying period only could not be completed"
 			if drying_start_idx in range(first_valid_idx, last_valid_idx+1) and drying_end_idx in range(first_valid_idx, last_valid_idx+1):
 				pass
 			else:
-				print(f"Training for drying period only could not be completed, as the drying period is not completely included in the valid data range")
+				self.logger.warning(f"Training for drying period only could not be completed, as the drying period is not completely included in the valid data range")
 
 
 
@@ -143,13 +137,14 @@ class CLT_perform:
 			self.data_for_anal['y_imputed'] = y_imputed
 			self.data_for_anal.drop(columns=['y'], inplace=True)
 			self.data_for_anal.rename(columns={'y_imputed': 'y'}, inplace=True)
-			print(f"after imputation, there is {self.data_for_anal['y'].isna().sum()} missing pt")
+			self.logger.info(f"after imputation, there is {self.data_for_anal['y'].isna().sum()} missing pt")
 
 		if 'regressor_list' in kwargs:
 			reg_help = RegressHelp()
 			for (regressor_name_lst, regressor_df) in kwargs['regressor_list']:
 				# match the timestep between regressor and time series; regressor_tuple([regressor_col_name1,...,regressor_col_nameN], regressor_dataframe)
-				adjusted_regr, self.data_for_anal = reg_help.matching_regr_data(regressor_df, self.data_for_anal)
+				with stage_metrics.stage('regressor alignment', rows=len(self.data_for_anal)):
+					adjusted_regr, self.data_for_anal = reg_help.matching_regr_data(regressor_df, self.data_for_anal)
 				for regressor_name in regressor_name_lst:
 					# add regressor data to the timeseries dataframe
 					self.data_for_anal[regressor_name] = adjusted_regr[regressor_name].values
@@ -160,39 +155,264 @@ class CLT_perform:
 			self.test_df =  self.data_for_anal[-forecast_horizon:].copy()
 		else:
 			self.train_df = self.data_for_anal.copy()
-		print(self.train_df.tail())
+		self.logger.debug(self.train_df.tail())
+
+
+	def train_N_forecast(self, train, forecast_param, use_hyperparam, save_model=True, **kwargs):
+		"""
+		- save_model: if False, the trained model is not saved to the model registry (e.g., when the caller collects models from worker processes and saves them itself)
+		- kwargs['warm_start']: see FB_prophet_train_forecast.train_forecast; the fits are also seeded from the model of the previous column of this file
+		- kwargs['trained_model']: name of a saved model of this file and column to retrain from (see load_model), e.g. 'initially_trained_model'
+		"""
+		if 'trained_model' in kwargs and isinstance(kwargs['trained_model'], str):
+			kwargs['trained_model'] = self.load_model(kwargs['trained_model'])
 
+		# warm start from the previous column, unless the caller gives its own init
+		warm_start = kwargs['warm_start'] if 'warm_start' in kwargs else config.WARM_START
+		if warm_start and 'init' not in kwargs and hasattr(self, 'warm_start_init'):
+			kwargs['init'] = self.warm_start_init
 
-	def train_N_forecast(self, train, forecast_param, use_hyperparam, **kwargs):
 		self.forecast_obj = FB_prophet_train_forecast()
 		self.forecast_results, self.trained_model = self.forecast_obj.train_forecast(train, forecast_param, use_hyperparam, **kwargs)
+		self.warm_start_init = model_init_params(self.trained_model)
+
+		# log the fit time and optimizer iterations of every candidate, if recorded
+		search_results = self.forecast_obj.search_results
+		if search_results is not None and 'Fit seconds' in search_results:
+			for _, row in search_results.iterrows():
+				self.logger.info(f"{row['Parameters']}: MAE {row['MAE']}, fit {row['Fit seconds']:.2f}s, {row['Iterations']} iterations, warm start: {row['Warm start']}")
 
 		# check if retrain an existing model
 		if 'trained_model' in kwargs:
-			model_name = 'retrained_model.json'
+			self.model_name = 'retrained_model'
 		else:
-			model_name = 'initially_trained_model.json'
+			self.model_name = 'initially_trained_model'
 
 		# evaluate the forecast results only when groundtruth data is given
 		if 'groundtruth' in kwargs:
-			self.eval_results_dict = self.forecast_obj.eval_model(kwargs['groundtruth'], self.forecast_results)
+			with stage_metrics.stage('evaluate', rows=len(kwargs['groundtruth'])):
+				self.eval_results_dict = self.forecast_obj.eval_model(kwargs['groundtruth'], self.forecast_results)
 			# log the evaluation results
 			for method, result in self.eval_results_dict.items():
 				self.logger.info(f"{method}: {result}")
 
 		# save the trained model (see: https://facebook.github.io/prophet/docs/additional_topics.html)
-		with open(os.path.sep.join([config.OUTPUT_PATH, model_name]), 'w') as fout:
-			json.dump(model_to_json(self.trained_model), fout)
+		if save_model:
+			self.save_model(self.trained_model, self.model_name, self.file_name, self.col_name)
+
+
+	def backtest(self, p=None, initial=None, period=None, horizon=None, n_jobs=None, freq='2H'):
+		"""
+		rolling-origin backtest (see backtest_helper.py) of the column prepared by preprocess or select_column
+		the regressors are already aligned in self.data_for_anal, so every cutoff only slices it
+			- p: hyperparameters, defaults to the best ones of the last train_N_forecast (or Prophet's defaults, if not trained yet)
+			- initial, period, horizon: in rows, default to config.BACKTEST_INITIAL, config.BACKTEST_PERIOD, config.BACKTEST_HORIZON
+			- n_jobs: number of worker processes fitting the cutoffs, defaults to config.BACKTEST_N_JOBS (None = all cores, 1 = serial)
+		Returns:
+			- self.backtest_results: a df('cutoff', 'step', 'ds', 'y', 'yhat', 'error'), one row per cutoff and horizon step
+		"""
+		if p is None:
+			if getattr(self, 'forecast_obj', None) is not None and self.forecast_obj.search_results is not None:
+				p = self.forecast_obj.search_results['Parameters'][0]
+			else:
+				p = {'changepoint_prior_scale': 0.05, 'seasonality_prior_scale': 10.0, 'seasonality_mode': 'additive'}
+		initial = config.BACKTEST_INITIAL if initial is None else initial
+		period = config.BACKTEST_PERIOD if period is None else period
+		horizon = config.BACKTEST_HORIZON if horizon is None else horizon
+		n_jobs = config.BACKTEST_N_JOBS if n_jobs is None else n_jobs
+
+		data = self.data_for_anal.reset_index(drop=True)
+		regressor_names = [col_name for col_name in data.columns if col_name not in ['ds', 'y']]
+		cutoffs = backtest_helper.rolling_origin_cutoffs(len(data), initial, period, horizon)
+		self.logger.info(f"backtest of {self.col_name}: {len(cutoffs)} cutoffs, params {p}")
 
+		forecast = partial(forecast_cutoff, data=data, p=p, forecast_params={'periods': horizon, 'freq': freq}, regressor_names=regressor_names)
+		self.backtest_results = backtest_helper.run_backtest(forecast, data['ds'], data['y'], cutoffs, horizon, n_jobs)
+		return self.backtest_results
 
-	def plot_results(self, fig_name, trained_model, forecast_results):
+
+	def append_rows(self, new_data):
 		"""
-		use the built-in plotting method to plot the forecast results, see: https://facebook.github.io/prophet/docs/quick_start.html#python-api
+		appends newly arrived readings to self.worksheet
+			- new_data: a csv export (path) or a df in the worksheet layout ('DateTime' + sensor columns, or 'DateTime' + 'Aggregate' if agg)
+		Returns:
+			- the appended rows (rows up to the last known timestamp are ignored)
 		"""
+		if isinstance(new_data, str):
+			new_data = IngestHelp().parse_sensor_sheet(new_data)
+		new_rows = new_data[new_data['DateTime'] > self.worksheet.index[-1]].copy()
+
+		# same derived column as __init__ (the aggregate is over every sensor column of the export, kept in the worksheet or not)
+		# a df in the layout of an aggregate worksheet ('DateTime' + 'Aggregate' only) keeps its 'Aggregate'
+		if self.agg == True:
+			sensor_columns = [col_name for col_name in new_rows.columns if col_name not in ['Aggregate', 'DateTime']]
+			if sensor_columns:
+				new_rows['Aggregate'] = new_rows[sensor_columns].astype(float).mean(axis=1, skipna=True)
+			elif 'Aggregate' not in new_rows.columns:
+				raise ValueError("new_data has neither sensor columns nor an 'Aggregate' column")
+
+		self.worksheet = self.worksheet.append(new_rows)
+		return new_rows
 
-		fig = trained_model.plot(forecast_results[['ds', 'yhat', 'yhat_lower', 'yhat_upper']])
-		ax = fig.gca()
-		ax.set_xlabel("Time", size=20)
-		ax.set_ylabel(self.col_name, size=20)
-		fig.savefig(os.path.sep.join([config.OUTPUT_PATH,'{}.png'.format(fig_name)]), dpi=600)
+
+	def update_forecast(self, new_data, forecast_param, **kwargs):
+		"""
+		incremental mode: appends newly arrived readings to the series prepared by preprocess(in_sample_forecast=False) and refreshes the forecast,
+		refitting the previously chosen best parameters warm-started from the saved model, instead of redoing the ingest, preprocess and hyperparameter search
+			- new_data: see append_rows
+			- forecast_param: see train_N_forecast
+			- kwargs['trained_model']: name of the saved model of this file and column to refit and replace (see load_model), defaults to 'initially_trained_model'
+			- kwargs['impute'], kwargs['regressor_list']: as given to preprocess
+			- kwargs['regr_future'] or kwargs['regressor_trans_func']: regressor values for the forecast periods, as for train_N_forecast
+		the full search (train_N_forecast with hyperparameters, the last forecast_param['periods'] points held out) reruns first when:
+			- config.FULL_SEARCH_EVERY updates have been made since the last search, or
+			- the MAE of the previous forecast on the new readings exceeds config.DRIFT_TOLERANCE times the MAE of the last search
+		the schedule/drift state is kept per file and column next to the model (see state_path); before any full search, the MAE it compares with
+		is the held-out MAE of the initial search of this object (train_N_forecast), or else the first MAE measured on new readings
+		nothing is refitted when new_data holds no new rows
+		"""
+		model_name = kwargs.pop('trained_model', 'initially_trained_model')
+		# append only the new rows of the prepared column
+		new_rows = self.append_rows(new_data)
+		if len(new_rows) == 0:
+			self.logger.info(f"no new rows for {self.col_name}, forecast not updated")
+			return
+
+		state_path = self.state_path(model_name)
+		if os.path.exists(state_path):
+			with open(state_path, 'r') as fin:
+				state = json.load(fin)
+		else:
+			state = {'updates_since_search': 0, 'search_MAE': None, 'last_forecast': None}
+			if getattr(self, 'eval_results_dict', None):
+				state['search_MAE'] = self.eval_results_dict['MAE']
+
+		new_series = pd.DataFrame({'ds': new_rows['DateTime'].values, 'y': new_rows[self.col_name].values.astype(float)})
+		observed = new_series.dropna()
+		if 'impute' in kwargs and new_series['y'].isna().any():
+			my_imputer = SimpleImputer(strategy=kwargs['impute']).fit(self.train_df[['y']])
+			new_series['y'] = my_imputer.transform(new_series[['y']])[:, 0]
+		if 'regressor_list' in kwargs:
+			for (regressor_name_lst, regressor_df) in kwargs['regressor_list']:
+				for regressor_name in regressor_name_lst:
+					new_series[regressor_name] = regressor_df[regressor_name].reindex(new_series['ds'], method='ffill').values
+		if isinstance(self.train_df.index, pd.DatetimeIndex):
+			new_series.index = pd.DatetimeIndex(new_series['ds'], name=self.train_df.index.name)
+		else:
+			new_series.index = pd.RangeIndex(len(self.worksheet) - len(new_rows), len(self.worksheet))
+		self.train_df = pd.concat([self.train_df, new_series[self.train_df.columns]])
+		self.logger.info(f"{len(new_rows)} new rows appended to {self.col_name}, last timestamp: {self.train_df['ds'].iloc[-1]}")
+
+		# error drift: how did the previous forecast do on the readings that just arrived
+		drift_MAE = None
+		if state['last_forecast'] is not None:
+			last_forecast = pd.DataFrame(state['last_forecast'])
+			last_forecast['ds'] = pd.to_datetime(last_forecast['ds'])
+			matched = last_forecast.merge(observed, on='ds')
+			if len(matched) > 0:
+				drift_MAE = mean_absolute_error(matched['y'], matched['yhat'])
+				self.logger.info(f"MAE of the previous forecast on the new readings: {drift_MAE}")
+				# no search yet: the first out-of-sample MAE is the reference of the later ones
+				if state['search_MAE'] is None:
+					state['search_MAE'] = drift_MAE
+
+		full_search = state['updates_since_search'] + 1 >= config.FULL_SEARCH_EVERY
+		if drift_MAE is not None and state['search_MAE'] is not None and drift_MAE > config.DRIFT_TOLERANCE * state['search_MAE']:
+			full_search = True
+
+		if full_search:
+			self.logger.info("rerunning the full hyperparameter search")
+			horizon = forecast_param['periods']
+			search_kwargs = {key: value for (key, value) in kwargs.items() if key not in ('regr_future', 'impute')}
+			self.train_N_forecast(self.train_df.iloc[:-horizon], forecast_param, True, save_model=False, groundtruth=self.train_df.iloc[-horizon:], regr_future=self.train_df.iloc[-horizon:], **search_kwargs)
+			state['search_MAE'], state['updates_since_search'] = self.eval_results_dict['MAE'], 0
+			m = self.trained_model
+		else:
+			m = self.load_model(model_name)
+			state['updates_since_search'] += 1
+
+		# refit the best parameters on the whole updated series, warm-started from the previous fit
+		best_params = model_hyperparams(m)
+		regressor_names = list(m.extra_regressors)
+		future_regr = None
+		if regressor_names:
+			future_regr = FB_prophet_train_forecast().prepare_future_regr(self.train_df, forecast_param, regressor_names, **kwargs)
+		self.trained_model, self.forecast_results = fit_predict(best_params, self.train_df, forecast_param, regressor_names=regressor_names, future_regr=future_regr, init=model_init_params(m))
+		self.model_name = model_name
+		self.save_model(self.trained_model, model_name, self.file_name, self.col_name)
+
+		state['last_forecast'] = {
+			'ds': [str(ds) for ds in self.forecast_results['ds'].iloc[-forecast_param['periods']:]],
+			'yhat': self.forecast_results['yhat'].iloc[-forecast_param['periods']:].tolist(),
+		}
+		with open(state_path, 'w') as fout:
+			json.dump(state, fout)
+
+
+	def state_path(self, model_name):
+		"""
+		the file of the update state (see update_forecast) of the model 'model_name' of this file and column
+		"""
+		series_key = hashlib.sha1(json.dumps([self.file_name, self.col_name]).encode('utf-8')).hexdigest()[:12]
+		return os.path.join(config.OUTPUT_PATH, f"{model_name}_state_{series_key}.json")
+
+
+	@staticmethod
+	def save_model(model, model_name, file_name, col_name):
+		"""
+		save a trained model to the model registry in config.MODEL_REGISTRY_PATH (see registry_helper.py), under its sensor file, column and hyperparameters
+			- model_name: label to load it by, e.g. 'initially_trained_model'
+		"""
+		ModelRegistry(config.MODEL_REGISTRY_PATH).save(model, file_name, col_name, 'prophet', model_hyperparams(model), name=model_name, versions=library_versions('prophet', 'cmdstanpy'))
+
+
+	def load_model(self, model_name):
+		"""
+		the model 'model_name' of this file and column saved most recently to the model registry; only that model is read
+		models saved as json by earlier versions (config.OUTPUT_PATH/<model_name>.json) are still found, by 'name' or 'name.json'
+		"""
+		if model_name.endswith('.json'):
+			model_name = model_name[:-len('.json')]
+		m = ModelRegistry(config.MODEL_REGISTRY_PATH).get(file=self.file_name, column=self.col_name, model_type='prophet', name=model_name)
+		if m is None:
+			with open(os.path.sep.join([config.OUTPUT_PATH, model_name + '.json']), 'r') as fin:
+				m = model_from_json(json.load(fin))
+		return m
+
+
+	def forecast_saved(self, forecast_param, model_name='initially_trained_model', **kwargs):
+		"""
+		forecasts with the saved model 'model_name' of this file and column (see load_model), without refitting it
+			- forecast_param: see train_N_forecast
+			- kwargs['regr_future'] or kwargs['regressor_trans_func']: regressor values for the forecast periods, as for train_N_forecast
+		"""
+		self.trained_model = self.load_model(model_name)
+		self.model_name = model_name
+		regressor_names = list(self.trained_model.extra_regressors)
+		future = self.trained_model.make_future_dataframe(**forecast_param)
+		if regressor_names:
+			future_regr = FB_prophet_train_forecast().prepare_future_regr(model_history(self.trained_model), forecast_param, regressor_names, **kwargs)
+			for regressor_name in regressor_names:
+				future[regressor_name] = future_regr[regressor_name].values
+		self.forecast_results = self.trained_model.predict(future)
+		return self.forecast_results
+
+
+	def plot_results(self, fig_name, trained_model, forecast_results, plots=None):
+		"""
+		plot the forecast results like the built-in plotting method, see: https://facebook.github.io/prophet/docs/quick_start.html#python-api
+		"""
+		self.render_forecast_plot(fig_name, trained_model.history, forecast_results, self.col_name, plots)
+
+
+	@staticmethod
+	def render_forecast_plot(fig_name, history, forecast_results, col_name, plots=None):
+		"""
+		same as plot_results, but does not need a CLT_perform instance (e.g., plotting results gathered from worker processes)
+			- history: df('ds', 'y') the model was trained on (trained_model.history)
+			- plots: a PlotHelp rendering in the background; without it, the figure is rendered before returning
+		"""
+		if plots is None:
+			plots = PlotHelp(config.PLOTS, config.PLOT_DPI, config.PLOT_FORMAT, config.PLOT_MAX_POINTS, n_workers=0)
+		plots.forecast_plot(config.OUTPUT_PATH, fig_name, history, forecast_results, col_name)
 
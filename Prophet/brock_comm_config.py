@@ -1,6 +1,10 @@
 """
 This config file stores 
 """
+import os
+
+# settings shared with the Darts pipeline (caches, logging, backtests, figures)
+from shared_config import *
 
 # path to datasheets
 DATASHEETS_PATH = 'TALLWOOD DATA'
@@ -9,5 +13,49 @@ DATASHEETS_PATH = 'TALLWOOD DATA'
 CLIMATE_DATA_PATH = 'climate_data'
 
 # path to output files
-OUTPUT_PATH = 'Prophet\output'
+OUTPUT_PATH = os.path.join('Prophet', 'output')
+
+# path to the model registry: every trained model, per sensor file, column and hyperparameters (see registry_helper.py)
+MODEL_REGISTRY_PATH = os.path.join(OUTPUT_PATH, 'models')
+
+# number of worker processes used by Prophet_Pipeline to forecast sensor files in parallel (1 = serial)
+N_WORKERS = 1
+
+# number of worker processes scoring hyperparameter candidates in FB_prophet_train_forecast (None = all cores, 1 = serial)
+GRID_N_JOBS = None
+
+# hyperparameter grids of FB_prophet_train_forecast, by name; PARAM_GRID is the one searched ('full' = 18 candidates)
+PARAM_GRIDS = {
+    'full': {'seasonality_mode': ('multiplicative', 'additive'),
+             'changepoint_prior_scale': [0.001, 0.05, 0.1],
+             'seasonality_prior_scale': [0.01, 1.0, 10.0]},
+    'small': {'seasonality_mode': ('multiplicative', 'additive'),
+              'changepoint_prior_scale': [0.05],
+              'seasonality_prior_scale': [1.0, 10.0]},
+    # Prophet's default hyperparameters only
+    'single': {'seasonality_mode': ('additive',),
+               'changepoint_prior_scale': [0.05],
+               'seasonality_prior_scale': [10.0]},
+}
+PARAM_GRID = 'full'
+
+# hyperparameter search strategy of FB_prophet_train_forecast: 'grid' (exhaustive) or 'successive_halving'
+SEARCH_STRATEGY = 'grid'
+# successive halving: keep the best 1/SH_ETA candidates per rung, the first of SH_N_RUNGS rungs fits on len(train) // SH_ETA**(SH_N_RUNGS-1) rows
+# [caution] slices much shorter than 2 years cannot identify the yearly seasonality, so their ranking is unreliable; 3 & 2 matched the grid on 'String Pots'
+SH_ETA = 3
+SH_N_RUNGS = 2
+
+# seed the optimizer of each grid candidate from a neighbouring candidate (and each sensor column from the previous one), see FB_prophet_train_forecast
+# [caution] a seeded fit may stop close to the seed's optimum, so candidate scores can differ from cold fits; fit time and iterations are logged to compare
+WARM_START = False
+
+# content-addressed cache of every grid candidate fit and of the final model/forecast of every series (see artifact_helper.py),
+# so an interrupted or repeated run loads the fits already done; None disables it. Least recently used entries are evicted above ARTIFACT_CACHE_MAX_MB
+ARTIFACT_CACHE_PATH = os.path.join('cache', 'artifacts')
+ARTIFACT_CACHE_MAX_MB = 2048
 
+# incremental updates (CLT_perform.update_forecast): rerun the full hyperparameter search every FULL_SEARCH_EVERY updates (84 = a week of 2-hour readings),
+# or as soon as the previous forecast misses the new readings by more than DRIFT_TOLERANCE times the MAE of the last search
+FULL_SEARCH_EVERY = 84
+DRIFT_TOLERANCE = 2.0
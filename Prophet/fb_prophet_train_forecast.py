@@ -5,19 +5,226 @@ Reference: https://www.kaggle.com/kmkarakaya/missing-data-and-time-series-predic
 """
 
 import Prophet.brock_comm_config as config
-from Prophet.regressor_helper import RegressHelp
 from prophet import Prophet
 from sklearn.metrics import mean_absolute_error
 import os
 import pandas as pd
 import json
-from prophet.serialize import model_to_json, model_from_json
+from prophet.serialize import model_from_json
 from sklearn.model_selection import ParameterGrid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
+import time
+from metrics_helper import stage_metrics
+from log_helper import get_logger, worker_logging, worker_logging_args
+from eval_helper import evaluate
+from artifact_helper import ArtifactCache, library_versions, source_digest
+
+# salt of the artifact cache keys of this process, see artifact_cache()
+_artifact_salt = None
+
+
+def artifact_cache():
+    """
+    the content-addressed cache of the candidate fits and final forecasts (see artifact_helper.py), or None if config.ARTIFACT_CACHE_PATH is None
+    the code of this module and the library versions are part of every key, so editing this module (or upgrading a library) misses the old entries
+    """
+    global _artifact_salt
+    if config.ARTIFACT_CACHE_PATH is None:
+        return None
+    if _artifact_salt is None:
+        _artifact_salt = {'code': source_digest(__file__), **library_versions('prophet', 'cmdstanpy', 'pandas', 'numpy', 'scikit-learn')}
+    return ArtifactCache(config.ARTIFACT_CACHE_PATH, config.ARTIFACT_CACHE_MAX_MB, _artifact_salt)
+
+
+def model_init_params(m):
+    """
+    returns the fitted params of a Prophet model in the format expected by .fit(init=...), see: https://facebook.github.io/prophet/docs/additional_topics.html#updating-fitted-models
+    """
+    res = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        res[pname] = m.params[pname][0][0]
+    for pname in ['delta', 'beta']:
+        res[pname] = m.params[pname][0]
+    return res
+
+
+def model_hyperparams(m):
+    """
+    the hyperparameters of a Prophet model, in the format of the parameter grid
+    """
+    return {'changepoint_prior_scale': m.changepoint_prior_scale, 'seasonality_prior_scale': m.seasonality_prior_scale, 'seasonality_mode': m.seasonality_mode}
+
+
+
+def model_history(m):
+    """
+    the history of a fitted Prophet model, with its regressors back to the values it was trained on (m.history holds them standardized)
+    """
+    history = m.history.copy()
+    for regressor_name, props in m.extra_regressors.items():
+        history[regressor_name] = history[regressor_name] * props['std'] + props['mu']
+    return history
+
+def fit_predict(p, train, forecast_params, regressor_names=(), future_regr=None, init=None, fit_stats=False):
+    """
+    fits ONE Prophet model with the hyperparameters 'p' and makes the forecast
+    module-level (not a method) so grid candidates can be sent to worker processes
+    Arguments:
+        - p: a dict of hyperparameters, one element of the ParameterGrid
+        - regressor_names: names of the regressor columns in 'train'
+        - future_regr: a df of regressor values for the whole future dataframe (history + forecast periods)
+        - init: initial values for the optimizer, e.g., params of a previously trained model
+        - fit_stats: if True, the fit time and the number of optimizer iterations are stored in m.fit_stats
+    """
+    np.random.seed(0)
+    m = Prophet(
+        changepoint_prior_scale = p['changepoint_prior_scale'],
+        seasonality_prior_scale = p['seasonality_prior_scale'],
+        seasonality_mode = p['seasonality_mode'],
+        weekly_seasonality=True,
+        daily_seasonality = True,
+        yearly_seasonality = True,
+        interval_width=0.95
+    )
+    for regressor_name in regressor_names:
+        # add regressor to the model
+        m.add_regressor(regressor_name)
+
+    # train the model ('train' should contain already-transformed regressor values)
+    fit_kwargs = {}
+    if init is not None:
+        fit_kwargs['init'] = init
+    if fit_stats:
+        # cmdstanpy keeps one row per optimizer iteration
+        fit_kwargs['save_iterations'] = True
+    fit_start = time.perf_counter()
+    with stage_metrics.stage('prophet fit', rows=len(train)):
+        m.fit(train, **fit_kwargs)
+    if fit_stats:
+        m.fit_stats = {
+            'Fit seconds': time.perf_counter() - fit_start,
+            'Iterations': len(m.stan_backend.stan_fit.optimized_iterations_np),
+            'Warm start': init is not None,
+        }
+
+    # make forecast
+    future = m.make_future_dataframe(**forecast_params)
+    for regressor_name in regressor_names:
+        future[regressor_name] = future_regr[regressor_name].values
+    with stage_metrics.stage('prophet predict', rows=len(future)):
+        forecast = m.predict(future)
+
+    return m, forecast
+
+
+def score_candidate(p, train, forecast_params, groundtruth, **fit_kwargs):
+    """
+    returns the MAE of ONE grid candidate on the groundtruth data, together with its fitted model and forecast
+    the stage records of the fit are moved to m.stage_records, so they reach the parent when this runs in a worker process
+    the result is loaded from the artifact cache if the same candidate was scored on the same data before (e.g. by an interrupted run)
+    """
+    since = len(stage_metrics.records)
+    cache = artifact_cache()
+    if cache is not None:
+        key = cache.key('prophet candidate', p, train, forecast_params, groundtruth['y'], fit_kwargs)
+        with stage_metrics.stage('artifact cache load', rows=len(train)):
+            cached = cache.get(key)
+        if cached is not None:
+            MAE, m, forecast = cached
+            m.stage_records = stage_metrics.drain(since)
+            return MAE, m, forecast
+
+    m, forecast = fit_predict(p, train, forecast_params, **fit_kwargs)
+    MAE = mean_absolute_error(groundtruth['y'], forecast['yhat'][-forecast_params['periods']:])
+    if cache is not None:
+        cache.put(key, (MAE, m, forecast))
+    m.stage_records = stage_metrics.drain(since)
+    return MAE, m, forecast
+
+
+def forecast_cutoff(cutoff, data, p, forecast_params, regressor_names=()):
+    """
+    one cutoff of a backtest (see backtest_helper.run_backtest): fits ONE Prophet model with the hyperparameters 'p' on the rows of 'data' before 'cutoff'
+    and returns the forecast of the next forecast_params['periods'] rows
+    the regressor values of the forecast window are taken from 'data' (by position, as prepare_future_regr does for in-sample forecasts)
+    """
+    periods = forecast_params['periods']
+    future_regr = data[list(regressor_names)].iloc[:cutoff + periods]
+    m, forecast = fit_predict(p, data.iloc[:cutoff], forecast_params, regressor_names, future_regr)
+    return forecast['yhat'].values[-periods:]
+
+
+def score_chain(chain, train, forecast_params, groundtruth, init=None, **fit_kwargs):
+    """
+    scores the candidates of a chain one after another, seeding the optimizer of each fit with the params of the previous one (warm start)
+    Returns:
+        - a list of (MAE, model, forecast, fit_stats), one per candidate; model and forecast are None except for the best candidate of the chain
+    """
+    results = []
+    best_idx, best_fit = None, None
+    chain_records = []
+    for p in chain:
+        MAE, m, forecast = score_candidate(p, train, forecast_params, groundtruth, init=init, **fit_kwargs)
+        init = model_init_params(m)
+        chain_records += m.stage_records
+        results.append((MAE, None, None, getattr(m, 'fit_stats', {})))
+        if best_idx is None or MAE < results[best_idx][0]:
+            best_idx, best_fit = len(results) - 1, (m, forecast)
+
+    # the stage records of the whole chain travel with the one model that is returned
+    best_fit[0].stage_records = chain_records
+    results[best_idx] = (results[best_idx][0],) + best_fit + (results[best_idx][3],)
+    return results
+
+
+class BestFitCache:
+    """
+    keeps the fitted model and forecast of the best 'maxsize' candidates scored so far, keyed by their parameter dict
+    so the winner of a grid search does not have to be fitted a second time
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.entries = [] # [(MAE, key, model, forecast)], best first
+
+    @staticmethod
+    def key(p):
+        return tuple(sorted(p.items()))
+
+    def offer(self, p, MAE, m, forecast):
+        # insert after any entry with an equal MAE, so ties keep the earlier candidate (same as a stable sort)
+        position = len([entry for entry in self.entries if entry[0] <= MAE])
+        if position < self.maxsize:
+            self.entries.insert(position, (MAE, self.key(p), m, forecast))
+            del self.entries[self.maxsize:]
+
+    def get(self, p):
+        """
+        returns (model, forecast) of the candidate 'p', or None if it is not cached
+        """
+        for (_, key, m, forecast) in self.entries:
+            if key == self.key(p):
+                return m, forecast
+        return None
 
 
 class FB_prophet_train_forecast:
 
+    # available hyperparameter search strategies: {name: method}, all methods share the signature of grid_search
+    SEARCH_STRATEGIES = {
+        'grid': 'grid_search',
+        'successive_halving': 'successive_halving_search',
+    }
+
+    # with warm start, candidates sharing these params form a chain (only 'seasonality_prior_scale' changes from one fit to the next)
+    WARM_START_CHAIN_KEYS = ('seasonality_mode', 'changepoint_prior_scale')
+
+    def __init__(self):
+        # the logger of CLT_perform's run (see log_helper.py)
+        self.logger = get_logger(__name__, config.LOG_PATH, config.LOG_LEVEL)
+
     def train_forecast(self,train,forecast_params, use_hyperparam, **kwargs):
         """
         Arguments:
@@ -25,203 +232,271 @@ class FB_prophet_train_forecast:
             - forecast_params: a dict of params for .make_future_dataframe(), e.g., {'periods': xx, 'freq': yy}
             - kwargs['regressor_list']: a list containing all the regressor column names
             - kwargs['regressor_trans_func']: a dict of transformation fucntions for regressors, {'regressor_name': func, ...}
+            - kwargs['n_jobs']: number of worker processes scoring the grid candidates, defaults to config.GRID_N_JOBS (None = all cores)
+            - kwargs['search_strategy']: a key of SEARCH_STRATEGIES, defaults to config.SEARCH_STRATEGY ('grid' = exhaustive)
+            - kwargs['param_grid']: the hyperparameter grid, {param: [values]}, defaults to config.PARAM_GRIDS[config.PARAM_GRID]
+            - kwargs['trained_model']: a trained Prophet model to retrain (seed) from, or the name of a model json in config.OUTPUT_PATH
+            - kwargs['warm_start']: if True, each candidate's optimizer is seeded from the fit of a neighbouring candidate, defaults to config.WARM_START
+            - kwargs['init']: params (see model_init_params) to seed the first fit of each chain with when warm starting, e.g., the model of the previous sensor column
+            - kwargs['fit_stats']: if True, fit time and optimizer iterations are added to self.search_results, defaults to the value of warm_start
+        the forecast, model and search results are loaded from the artifact cache if the same search ran on the same data before (see artifact_cache)
         """
         self.forecast_horizon = forecast_params['periods']
+        n_jobs = kwargs['n_jobs'] if 'n_jobs' in kwargs else config.GRID_N_JOBS
+        warm_start = kwargs['warm_start'] if 'warm_start' in kwargs else config.WARM_START
+        fit_stats = kwargs['fit_stats'] if 'fit_stats' in kwargs else warm_start
+        search_kwargs = {'warm_start': warm_start, 'fit_stats': fit_stats}
+        search_strategy = kwargs['search_strategy'] if 'search_strategy' in kwargs else config.SEARCH_STRATEGY
+        if search_strategy not in self.SEARCH_STRATEGIES:
+            raise ValueError(f"unknown search_strategy '{search_strategy}', expecting one of {list(self.SEARCH_STRATEGIES)}")
+        search = getattr(self, self.SEARCH_STRATEGIES[search_strategy])
+        params_grid = kwargs['param_grid'] if 'param_grid' in kwargs else config.PARAM_GRIDS[config.PARAM_GRID]
+
+        # everything the result depends on; n_jobs does not change it. A retrained model file or regressor functions cannot be hashed, so skip the cache then
+        cache = artifact_cache()
+        if cache is not None and 'trained_model' not in kwargs and 'regressor_trans_func' not in kwargs:
+            search_inputs = {name: value for (name, value) in kwargs.items() if name != 'n_jobs'}
+            search_inputs.update(warm_start=warm_start, fit_stats=fit_stats, search_strategy=search_strategy, param_grid=params_grid, sh=(config.SH_ETA, config.SH_N_RUNGS))
+            key = cache.key('prophet train_forecast', train, forecast_params, use_hyperparam, search_inputs)
+            with stage_metrics.stage('artifact cache load', rows=len(train)):
+                cached = cache.get(key)
+            if cached is not None:
+                forecast, m, self.search_results = cached
+                return forecast, m
+        else:
+            cache = None
 
         # prepare parameter grid if using hyperparameter tuning
         if use_hyperparam == True:
-            params_grid = {'seasonality_mode':('multiplicative','additive'),
-                           'changepoint_prior_scale':[0.001, 0.05, 0.1],
-                           'seasonality_prior_scale' : [0.01, 1.0, 10.0]
-                          }
             grid = ParameterGrid(params_grid)
-            model_parameters = pd.DataFrame(columns = ['MAE','Parameters'])
 
         # check if retrain an existing model, see: https://facebook.github.io/prophet/docs/additional_topics.html#updating-fitted-models
         if 'trained_model' in kwargs:
-            # load the model
-            with open(os.path.sep.join([config.OUTPUT_PATH,kwargs['trained_model']]), 'r') as fin:
-                m = model_from_json(json.load(fin))
+            # load the model, unless it is given already
+            m = kwargs['trained_model']
+            if isinstance(m, str):
+                with open(os.path.sep.join([config.OUTPUT_PATH,kwargs['trained_model']]), 'r') as fin:
+                    m = model_from_json(json.load(fin))
 
             # get params
-            res = {}
-            for pname in ['k', 'm', 'sigma_obs']:
-                res[pname] = m.params[pname][0][0]
-            for pname in ['delta', 'beta']:
-                res[pname] = m.params[pname][0]
+            res = model_init_params(m)
 
             # do hyperparameter gridsearch and find the best parameters
-            for p in grid:
-                np.random.seed(0)
-                m = Prophet(
-                    changepoint_prior_scale = p['changepoint_prior_scale'],
-                    seasonality_prior_scale = p['seasonality_prior_scale'],
-                    seasonality_mode = p['seasonality_mode'],
-                    weekly_seasonality=True,
-                    daily_seasonality = True,
-                    yearly_seasonality = True, 
-                    interval_width=0.95
-                ).fit(train, init=res)
-                # make forecast
-                future = m.make_future_dataframe(**forecast_params)
-                forecast = m.predict(future)
-                MAE = self.eval_model(kwargs['groundtruth'], forecast)['MAE']
-                model_parameters = model_parameters.append({'MAE':MAE,'Parameters':p},ignore_index=True)
-            
-            # sort the hyperparameters set based on MAE
-            parameters = model_parameters.sort_values(by=['MAE']).reset_index(drop=True)
-            parameters.head()
-
-            # retrain and predict using the best parameters
-            parameters['Parameters'][0]
-            m = Prophet(
-                    changepoint_prior_scale = parameters['Parameters'][0]['changepoint_prior_scale'],
-                    seasonality_prior_scale = parameters['Parameters'][0]['seasonality_prior_scale'],
-                    seasonality_mode = parameters['Parameters'][0]['seasonality_mode'],
-                    weekly_seasonality=True,
-                    daily_seasonality = True,
-                    yearly_seasonality = True, 
-                    interval_width=0.95
-                ).fit(train, init=res)
-                # make forecast
-            future = m.make_future_dataframe(**forecast_params)
-            forecast = m.predict(future)
-            
+            parameters = search(grid, train, forecast_params, kwargs['groundtruth'], n_jobs, init=res, **search_kwargs)
+
+            # reuse the fit of the best parameters (only refit if it somehow is not cached)
+            m, forecast = self.best_fit(parameters['Parameters'][0], train, forecast_params, init=res, fit_stats=fit_stats)
+
         else:
                 if 'regressor_list' in kwargs:
+                    regressor_names = [regressor_name for (regressor_name_lst, _) in kwargs['regressor_list'] for regressor_name in regressor_name_lst]
+                    # the future regressor values are the same for every candidate, so build them once
+                    future_regr = self.prepare_future_regr(train, forecast_params, regressor_names, **kwargs)
+
+                    # seed the chains from a previous fit (e.g., the previous sensor column), if warm starting
+                    if warm_start and 'init' in kwargs:
+                        search_kwargs['init'] = kwargs['init']
+
+                    # do hyperparameter gridsearch and find the best parameters
+                    parameters = search(grid, train, forecast_params, kwargs['groundtruth'], n_jobs, regressor_names=regressor_names, future_regr=future_regr, **search_kwargs)
 
-                    for p in grid:
-                        np.random.seed(0)
-                        m = Prophet(
-                            changepoint_prior_scale = p['changepoint_prior_scale'],
-                            seasonality_prior_scale = p['seasonality_prior_scale'],
-                            seasonality_mode = p['seasonality_mode'],
-                            weekly_seasonality=True,
-                            daily_seasonality = True,
-                            yearly_seasonality = True, 
-                            interval_width=0.95
-                        )
-
-                        #reg_help = RegressHelp()
-                        for (regressor_name_lst, _) in kwargs['regressor_list']:
-                            # match the timestep between regressor and time series; regressor_tuple([regressor_col_name1,...,regressor_col_nameN], regressor_dataframe)
-                            #adjusted_regr, train = reg_help.matching_regr_data(regressor_df, train)
-                            for regressor_name in regressor_name_lst:
-                                # add regressor data to training dataframe
-                                #train[regressor_name] = adjusted_regr[regressor_name].values
-                                #print(f"there is {sum(train[regressor_name].isna())} NaN in {train[regressor_name]}")
-                                #print(f"tail values for {regressor_name} is {train[regressor_name].tail()}")
-
-                                # add regressor to the model
-                                m.add_regressor(regressor_name)
-
-                        #print(f"train data looks like: {train.tail}")
-                        #print(f"index name of train is {train.index}")
-
-                        # train the model
-                        m.fit(train) # 'train' should contain already-transformed regressor values
-                        # make forecast
-                        future = m.make_future_dataframe(**forecast_params)
-                        #print(f"what does future look like? {future.tail()}")
-                        
-                        for (regressor_name_lst, _) in kwargs['regressor_list']:	
-                            for regressor_name in regressor_name_lst:			
-                                if 'regressor_trans_func' in kwargs: # dict{'regressor_name1': func1, ..., 'regressor_nameN': funcN}
-                                    # apply the same 'ds'-based transformation function (used to transform training data) to the future regressor values 
-                                    # [caution] the code below (apply func) has NOT been tested yet as of Aug.17, 2021
-                                    future[regressor_name] = future['ds'].apply(kwargs['regressor_trans_func'][regressor_name])
-                                else:
-                                    # use the historical data (last "forecast_params['periods']" data points) --> only works properly for in-sample prediction, need to provide a kwargs['test'] <<-this is not going to work, as index of test_df is not datetime obj
-                                    #future[regressor_name] = future['ds'].apply(lambda x: kwargs['test'].loc[x,regressor_name])
-                                    #print(f"future values for {regressor_name} is {future[regressor_name].tail()}")
-                                    n_future_regr_data = forecast_params['periods'] 
-                                    # concat the train df with designated amt of regressor data from a separate df. [Caution]: this will not work if: (1) no separate dataset for future values of regr is avaiable or (2) # of data points in that dataset is less than those needed for forecast
-                                    future[regressor_name] = pd.concat([train[regressor_name],kwargs["regr_future"][regressor_name][:n_future_regr_data]], axis=0).values
-
-                        print(f"what does future look like? {future.sample(24)}")
-                        forecast = m.predict(future)
-                        MAE = self.eval_model(kwargs['groundtruth'], forecast)['MAE']
-                        model_parameters = model_parameters.append({'MAE':MAE,'Parameters':p},ignore_index=True)
-            
-                    # sort the hyperparameters set based on MAE
-                    parameters = model_parameters.sort_values(by=['MAE']).reset_index(drop=True)
-                    parameters.head()
-
-            ###############################
-            # retrain and predict using the best parameters
-                    #parameters['Parameters'][0]
-                    m = Prophet(
-                            changepoint_prior_scale = parameters['Parameters'][0]['changepoint_prior_scale'],
-                            seasonality_prior_scale = parameters['Parameters'][0]['seasonality_prior_scale'],
-                            seasonality_mode = parameters['Parameters'][0]['seasonality_mode'],
-                            weekly_seasonality=True,
-                            daily_seasonality = True,
-                            yearly_seasonality = True, 
-                            interval_width=0.95
-                        )
-
-                    #reg_help = RegressHelp()
-                    for (regressor_name_lst, _) in kwargs['regressor_list']:
-                            # match the timestep between regressor and time series; regressor_tuple([regressor_col_name1,...,regressor_col_nameN], regressor_dataframe)
-                            #adjusted_regr, train = reg_help.matching_regr_data(regressor_df, train)
-                            for regressor_name in regressor_name_lst:
-                                # add regressor data to training dataframe
-                                #train[regressor_name] = adjusted_regr[regressor_name].values
-                                #print(f"there is {sum(train[regressor_name].isna())} NaN in {train[regressor_name]}")
-                                #print(f"tail values for {regressor_name} is {train[regressor_name].tail()}")
-
-                                # add regressor to the model
-                                m.add_regressor(regressor_name)
-
-                        #print(f"train data looks like: {train.tail}")
-                        #print(f"index name of train is {train.index}")
-
-                        # train the model
-                    m.fit(train) # 'train' should contain already-transformed regressor values
-                        # make forecast
-                    future = m.make_future_dataframe(**forecast_params)
-                        #print(f"what does future look like? {future.tail()}")
-                        
-                    for (regressor_name_lst, _) in kwargs['regressor_list']:	
-                            for regressor_name in regressor_name_lst:			
-                                if 'regressor_trans_func' in kwargs: # dict{'regressor_name1': func1, ..., 'regressor_nameN': funcN}
-                                    # apply the same 'ds'-based transformation function (used to transform training data) to the future regressor values 
-                                    # [caution] the code below (apply func) has NOT been tested yet as of Aug.17, 2021
-                                    future[regressor_name] = future['ds'].apply(kwargs['regressor_trans_func'][regressor_name])
-                                else:
-                                    # use the historical data (last "forecast_params['periods']" data points) --> only works properly for in-sample prediction, need to provide a kwargs['test'] <<-this is not going to work, as index of test_df is not datetime obj
-                                    #future[regressor_name] = future['ds'].apply(lambda x: kwargs['test'].loc[x,regressor_name])
-                                    #print(f"future values for {regressor_name} is {future[regressor_name].tail()}")
-                                    n_future_regr_data = forecast_params['periods'] 
-                                    # concat the train df with designated amt of regressor data from a separate df. [Caution]: this will not work if: (1) no separate dataset for future values of regr is avaiable or (2) # of data points in that dataset is less than those needed for forecast
-                                    future[regressor_name] = pd.concat([train[regressor_name],kwargs["regr_future"][regressor_name][:n_future_regr_data]], axis=0).values
-
-                    print(f"what does future look like? {future.sample(24)}")
-                    forecast = m.predict(future)
-            ###############################
-
-
-                else: 
+                    # reuse the fit of the best parameters (only refit if it somehow is not cached)
+                    m, forecast = self.best_fit(parameters['Parameters'][0], train, forecast_params, regressor_names=regressor_names, future_regr=future_regr, fit_stats=fit_stats)
+
+                else:
                     # train the model directly, if no regressor is provided (hyperparameter will not be available then!)
                      m = Prophet()
                      m.fit(train)
                     # make forecast
                      future = m.make_future_dataframe(**forecast_params)
                      forecast = m.predict(future)
-            
+                     parameters = None
+
+        # keep the scores (and fit stats, if any) of all candidates for logging
+        self.search_results = parameters
+        if cache is not None:
+            cache.put(key, (forecast, m, parameters))
+
         #print(f"shape of forecast obj: {forecast.shape}")
-        
-        print(f"tail of forecast results: {forecast[['ds', 'yhat']].tail()}")
+
+        self.logger.debug(f"tail of forecast results: {forecast[['ds', 'yhat']].tail()}")
         return forecast, m
 
 
+    def grid_search(self, grid, train, forecast_params, groundtruth, n_jobs=None, **fit_kwargs):
+        """
+        exhaustive search: scores every candidate of the grid on the full training data
+        the fitted model and forecast of the best candidate are kept in self.fit_cache
+        Returns:
+            - a df('MAE', 'Parameters') sorted by MAE, i.e., the best parameters are in row 0
+        """
+        candidates = list(grid)
+        self.fit_cache = BestFitCache()
+        MAE_list, stats_list = self.score_candidates(candidates, train, forecast_params, groundtruth, n_jobs, self.fit_cache, **fit_kwargs)
+
+        model_parameters = pd.DataFrame([{'MAE': MAE, 'Parameters': p, **stats} for (p, MAE, stats) in zip(candidates, MAE_list, stats_list)])
+
+        # sort the hyperparameters set based on MAE (stable, so the best row matches the cached candidate)
+        return model_parameters.sort_values(by=['MAE'], kind='mergesort').reset_index(drop=True)
+
+
+    @staticmethod
+    def search_plan(n_candidates, n_rows, search_strategy):
+        """
+        the fits a search will run, without running them: [(number of fits, rows of training data per fit)], one tuple per rung
+        (a single one for 'grid'); the best model is reused from the search, so no fit is added for it
+        """
+        if search_strategy == 'grid':
+            return [(n_candidates, n_rows)]
+        if search_strategy != 'successive_halving':
+            raise ValueError(f"unknown search_strategy '{search_strategy}', expecting one of {list(FB_prophet_train_forecast.SEARCH_STRATEGIES)}")
+        # same rungs as successive_halving_search
+        eta, n_rungs = config.SH_ETA, config.SH_N_RUNGS
+        plan = []
+        for rung in range(n_rungs):
+            plan.append((n_candidates, n_rows // eta**(n_rungs - 1 - rung)))
+            n_candidates = max(1, n_candidates // eta)
+        return plan
+
+
+    def successive_halving_search(self, grid, train, forecast_params, groundtruth, n_jobs=None, **fit_kwargs):
+        """
+        successive halving (see Jamieson & Talwalkar, 2016): every candidate is first scored on a short, recent slice of 'train';
+        only the best 1/eta of them are promoted to a slice eta times longer, until the survivors are fitted on the full history
+            - config.SH_ETA: promotion factor
+            - config.SH_N_RUNGS: number of rungs, the first one uses len(train) // eta**(n_rungs-1) rows
+            e.g., eta=3 & 2 rungs --> 18 candidates on the last third of the history, then the best 6 on the full history
+        the fitted model and forecast of the best full-history candidate are kept in self.fit_cache
+        Returns:
+            - a df('MAE', 'Parameters', 'Rows') sorted by rows used (desc) and MAE, i.e., the best parameters are in row 0
+        """
+        eta, n_rungs = config.SH_ETA, config.SH_N_RUNGS
+        survivors = list(grid)
+        self.fit_cache = BestFitCache()
+        model_parameters = []
+
+        for rung in range(n_rungs):
+            last_rung = rung == n_rungs - 1
+            n_rows = len(train) // eta**(n_rungs - 1 - rung)
+
+            # the forecast window stays the same, so the MAE of a short slice is still measured on the groundtruth data
+            rung_kwargs = dict(fit_kwargs)
+            if fit_kwargs.get('future_regr') is not None:
+                rung_kwargs['future_regr'] = fit_kwargs['future_regr'].iloc[len(train) - n_rows:]
+            MAE_list, stats_list = self.score_candidates(survivors, train.iloc[-n_rows:], forecast_params, groundtruth, n_jobs, self.fit_cache if last_rung else None, **rung_kwargs)
+            model_parameters += [{'MAE': MAE, 'Parameters': p, 'Rows': n_rows, **stats} for (p, MAE, stats) in zip(survivors, MAE_list, stats_list)]
+
+            # promote the best 1/eta (sorted() is stable, so ties keep the grid order)
+            if not last_rung:
+                ranking = sorted(range(len(survivors)), key=lambda idx: MAE_list[idx])
+                survivors = [survivors[idx] for idx in ranking[:max(1, len(survivors) // eta)]]
+
+        model_parameters = pd.DataFrame(model_parameters)
+        return model_parameters.sort_values(by=['Rows', 'MAE'], ascending=[False, True], kind='mergesort').reset_index(drop=True)
+
+
+    def score_candidates(self, candidates, train, forecast_params, groundtruth, n_jobs=None, fit_cache=None, warm_start=False, **fit_kwargs):
+        """
+        scores every candidate, concurrently on a process pool unless n_jobs == 1
+        with warm_start, candidates are grouped into chains (see WARM_START_CHAIN_KEYS) fitted one after another, and the chains run concurrently
+        the fitted models and forecasts are offered to 'fit_cache' (if given) and dropped otherwise
+        Returns:
+            - a list of MAE and a list of fit stats (dicts, empty unless fit_stats), both in the order of the candidates
+        """
+        if warm_start:
+            chains = {}
+            for idx, p in enumerate(candidates):
+                chains.setdefault(tuple(p[key] for key in self.WARM_START_CHAIN_KEYS), []).append(idx)
+            chains = list(chains.values())
+            score = partial(score_chain, train=train, forecast_params=forecast_params, groundtruth=groundtruth, **fit_kwargs)
+            tasks = [[candidates[idx] for idx in chain] for chain in chains]
+        else:
+            # 'init' only seeds chains; without warm start it still applies to every fit (e.g., retraining an existing model)
+            score = partial(score_candidate, train=train, forecast_params=forecast_params, groundtruth=groundtruth, **fit_kwargs)
+            tasks = candidates
+
+        if n_jobs == 1:
+            scored = map(score, tasks)
+        else:
+            pool = ProcessPoolExecutor(max_workers=min(n_jobs or os.cpu_count(), len(tasks)), initializer=worker_logging, initargs=worker_logging_args())
+            scored = pool.map(score, tasks)
+
+        results = [None] * len(candidates)
+        try:
+            if warm_start:
+                for chain, chain_results in zip(chains, scored):
+                    for idx, result in zip(chain, chain_results):
+                        results[idx] = result
+            else:
+                # only the current best model/forecast is held on to, the others are dropped as soon as they are scored
+                for idx, (MAE, m, forecast) in enumerate(scored):
+                    stage_metrics.extend(m.stage_records)
+                    m.stage_records = []
+                    if fit_cache is not None:
+                        fit_cache.offer(candidates[idx], MAE, m, forecast)
+                    results[idx] = (MAE, None, None, getattr(m, 'fit_stats', {}))
+        finally:
+            if n_jobs != 1:
+                pool.shutdown()
+
+        # offered in the order of the candidates, so ties are broken the same way as a serial search
+        if warm_start:
+            for p, (MAE, m, forecast, _) in zip(candidates, results):
+                if m is not None:
+                    stage_metrics.extend(m.stage_records)
+                    m.stage_records = []
+                    if fit_cache is not None:
+                        fit_cache.offer(p, MAE, m, forecast)
+
+        return [result[0] for result in results], [result[3] for result in results]
+
+
+    def best_fit(self, p, train, forecast_params, **fit_kwargs):
+        """
+        returns (model, forecast) of the candidate 'p' from the last search, fitting it again only on a cache miss
+        """
+        cached = self.fit_cache.get(p)
+        if cached is not None:
+            return cached
+        return fit_predict(p, train, forecast_params, **fit_kwargs)
+
+
+    def prepare_future_regr(self, train, forecast_params, regressor_names, **kwargs):
+        """
+        builds the regressor values of the future dataframe (history + forecast periods)
+        """
+        future_regr = {}
+        if 'regressor_trans_func' in kwargs: # dict{'regressor_name1': func1, ..., 'regressor_nameN': funcN}
+            # apply the same 'ds'-based transformation function (used to transform training data) to the future regressor values
+            # [caution] the code below (apply func) has NOT been tested yet as of Aug.17, 2021
+            # same dates as Prophet.make_future_dataframe()
+            history_dates = pd.Series(pd.to_datetime(train['ds'].unique())).sort_values()
+            last_date = history_dates.max()
+            dates = pd.date_range(start=last_date, periods=forecast_params['periods'] + 1, freq=forecast_params['freq'])
+            dates = dates[dates > last_date][:forecast_params['periods']]
+            future_ds = pd.Series(np.concatenate((np.array(history_dates), np.array(dates))))
+            for regressor_name in regressor_names:
+                future_regr[regressor_name] = future_ds.apply(kwargs['regressor_trans_func'][regressor_name]).values
+        else:
+            # use the historical data (last "forecast_params['periods']" data points) --> only works properly for in-sample prediction
+            n_future_regr_data = forecast_params['periods']
+            for regressor_name in regressor_names:
+                # concat the train df with designated amt of regressor data from a separate df. [Caution]: this will not work if: (1) no separate dataset for future values of regr is avaiable or (2) # of data points in that dataset is less than those needed for forecast
+                future_regr[regressor_name] = pd.concat([train[regressor_name],kwargs["regr_future"][regressor_name][:n_future_regr_data]], axis=0).values
+
+        return pd.DataFrame(future_regr)
+
+
     def eval_model(self, groundtruth, forecast_results):
         """
         Argument:
             - groundtruth: a df with same shape train_df, typically df('ds', 'y')
             - forecast_results: a df with a shape of (n,22), important info ('ds, 'yhat', 'yhat_lower', 'yhat_higher')
+        Returns:
+            - {metric: value} of every metric of eval_helper.METRICS, 'Coverage' being the share of groundtruth inside ['yhat_lower', 'yhat_upper']
         """
-        print(f"groundtruth shape is {groundtruth['y'].shape}")
-        print(f"forecast_results is {forecast_results['yhat'].shape}")
+        self.logger.debug(f"groundtruth shape is {groundtruth['y'].shape}")
+        self.logger.debug(f"forecast_results is {forecast_results['yhat'].shape}")
 
-        return {'MAE': mean_absolute_error(groundtruth['y'], forecast_results['yhat'][-self.forecast_horizon:])}
\ No newline at end of file
+        forecast_tail = forecast_results[['yhat', 'yhat_lower', 'yhat_upper']].tail(self.forecast_horizon).T.values
+        return evaluate(groundtruth['y'], *forecast_tail).iloc[0].to_dict()
@@ -1,91 +1,188 @@
 import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import Prophet.brock_comm_config as config
 from  Prophet.brock_comm_CLT_perform import CLT_perform
 from  Prophet.regressor_helper import RegressHelp
+from export_helper import ExportHelp
+from metrics_helper import stage_metrics
+from log_helper import setup_logging, worker_logging, worker_logging_args
+from eval_helper import evaluate, stack
+from plot_helper import PlotHelp
 
-def Prophet_Pipeline():
-    fileList = os.listdir('TALLWOOD DATA/BCTW Sensor Data')
+
+def prepare_regressors():
+    """
+    climate regressors shared by every sensor file; memoized by RegressHelp and memory-mapped from config.REGR_CACHE_PATH
+    """
+    climate_data_csv = os.path.sep.join([config.CLIMATE_DATA_PATH,'Haney_UBC_RF_ADMIN_climate_daily_2016-2020.csv'])
+    regress_try = RegressHelp()
+    regressor = regress_try.prepare_climate_regr(climate_data_csv, convert_day_to_hour_interval='2H',impute='mean', cache_dir=config.REGR_CACHE_PATH)
+    return [(['MEAN_TEMPERATURE','TOTAL_PRECIPITATION'],regressor)]
+
+
+def forecast_file(i, agg, forecast_horizon, grid_n_jobs=None, columns=None, search_kwargs=None):
+    """
+    runs preprocessing, training and forecasting for ONE sensor file
+    everything returned is picklable, so this can run in a worker process; plotting and file writes are left to the caller
+    - grid_n_jobs: number of worker processes scoring the hyperparameter grid (see FB_prophet_train_forecast.grid_search)
+    - columns: names of the sensor columns to forecast (all of them if None), ignored if agg
+    - search_kwargs: 'param_grid' and/or 'search_strategy' of FB_prophet_train_forecast.train_forecast, if not the config ones
+    """
+    # prepare variables
+    wb_name = i # sys path will be added within CLT_perform
+    forecast_params = {
+        'periods': forecast_horizon,
+        'freq': '2H',
+    }
+
+    # stage records of this call are returned with the results (this may run in a worker process)
+    since = len(stage_metrics.records)
+    with stage_metrics.stage('ingest', series=i) as record:
+        trial_1 = CLT_perform(wb_name, agg, columns)
+        record['rows'] = len(trial_1.worksheet)
+
+    with stage_metrics.stage('regressors', series=i):
+        regressor_lst = prepare_regressors()
+
+    ws = trial_1.worksheet
+    nameList = list(trial_1.data_columns)
+    #nameList = ['W 3rd Edge MC1A (8912/19)']
+    if agg==True:
+        nameList = ['Aggregate']
+    elif columns is not None:
+        nameList = [columnName for columnName in nameList if columnName in columns]
+        if not nameList:
+            raise ValueError(f"none of the columns {columns} is in {i}")
+
+    # Create prediction results DataFrame
+    df = pd.DataFrame(columns=['ds', 'yhat', 'yhat_lower', 'yhat_upper'])
+    # the trained model of every column, saved to the model registry by the caller
+    trained_models = {}
+
+    # impute and align regressors for every column at once, then pick one column at a time
+    with stage_metrics.stage('preprocess', series=i, rows=len(ws) * len(nameList)):
+        trial_1.preprocess_batch(nameList, forecast_horizon=forecast_horizon, impute='mean', regressor_list=regressor_lst)
+    if not trial_1.batch_columns:
+        raise ValueError(f"none of the columns {nameList} of {i} has valid data")
+    for columnName in trial_1.batch_columns:
+        stage_metrics.series = i[:-4] + '/' + columnName
+        trial_1.select_column(columnName)
+
+        regressor_trans_func = {
+            'MEAN_TEMPERATURE': lambda x: x,
+            'TOTAL_PRECIPITATION': lambda x: x,
+        }
+
+        # default using hyperparameter, otherwise set the third argument to False
+        with stage_metrics.stage('train_N_forecast', rows=len(trial_1.train_df)):
+            trial_1.train_N_forecast(trial_1.train_df, forecast_params, True, save_model=False, n_jobs=grid_n_jobs, regressor_list=regressor_lst, regr_future=trial_1.test_df, groundtruth=trial_1.test_df, **(search_kwargs or {}))
+        trained_models[columnName] = trial_1.trained_model
+
+        # initialize list of lists
+        data = trial_1.forecast_results[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(forecast_horizon)
+        df = df.append(data, ignore_index=True)
+        forecast_groundtruth_combined_df = pd.merge(df, trial_1.test_df[['ds','y']].copy().rename(columns={'y': 'groundtruth'}), on="ds")
+        #print(df)
+        #print(forecast_groundtruth_combined_df)
+
+        print('This is the forecast in ' + i)
+    stage_metrics.series = None
+
+    # only the last column is kept for plotting, as earlier columns share the same figure name
+    return {
+        'file': i,
+        'col_name': trial_1.col_name,
+        'eval_results_dict': trial_1.eval_results_dict,
+        'forecast_df': df,
+        'forecast_groundtruth_combined_df': forecast_groundtruth_combined_df,
+        'forecast_results': trial_1.forecast_results,
+        'groundtruth_df': trial_1.test_df,
+        'model_name': trial_1.model_name,
+        'trained_models': trained_models,
+        'history': trial_1.trained_model.history[['ds', 'y']],
+        'stage_metrics': stage_metrics.drain(since),
+    }
+
+
+def Prophet_Pipeline(n_workers=None, plots=None, files=None, columns=None, agg=True, forecast_horizon=300, grid_n_jobs=None, search_kwargs=None):
+    """
+    - n_workers: number of worker processes forecasting sensor files in parallel, defaults to config.N_WORKERS (1 = serial)
+    - plots: a PlotHelp to render the figures with, e.g. shared with Results_Analysis; the caller closes it.
+      Without it, the figures are rendered by a PlotHelp of this run, which is closed before returning
+    - files: names of the sensor files to forecast, defaults to every file in 'TALLWOOD DATA/BCTW Sensor Data'
+    - columns, search_kwargs: see forecast_file
+    - agg: if True, only the aggregate (mean) of the sensor columns of each file is forecast, which saves running time;
+      otherwise every column (or every column in 'columns')
+    - forecast_horizon: in 2-hour steps, 300 = 600 hr
+    - grid_n_jobs: number of worker processes scoring the hyperparameter grid of each file, defaults to config.GRID_N_JOBS,
+      or to a share of the cores with n_workers > 1
+    """
+    fileList = files if files is not None else os.listdir('TALLWOOD DATA/BCTW Sensor Data')
     #fileList = ["Floor 3.csv"]
-    
-    def append_to_excel(fpath, df, sheet_name):
-        with pd.ExcelWriter(fpath,engine='openpyxl', mode="a", if_sheet_exists='replace') as f:
-            df.to_excel(f, sheet_name=sheet_name)
-    
-    MAE_df = pd.DataFrame()     # create MAE dataframe
+    if n_workers is None:
+        n_workers = config.N_WORKERS
+
+    # result sheets are buffered and written once at the end of the run
+    export = ExportHelp(store_path=config.RESULT_STORE_PATH, excel=config.RESULT_STORE_EXCEL)
+    # figures are rendered in the background while the results are collected and exported
+    own_plots = plots is None
+    if own_plots:
+        plots = PlotHelp(config.PLOTS, config.PLOT_DPI, config.PLOT_FORMAT, config.PLOT_MAX_POINTS, config.PLOT_WORKERS)
+
     forecast_dict = {}
     groundtruth_dict = {}
-    
-    # If you want to save time by using aggregate data, you can let agg==True; If you want to iterate original dataset, use False
-    agg=True
-    
-    for i in fileList:
-        # prepare variables
-        wb_name = i # sys path will be added within CLT_perform
-        forecast_horizon = 300 # = 600 hr (interval is 2hr)
-        forecast_params = {
-            'periods': forecast_horizon, 
-            'freq': '2H',
-        }
-        
-        trial_1 = CLT_perform(wb_name, agg)
-    
-        climate_data_csv = os.path.sep.join([config.CLIMATE_DATA_PATH,'Haney_UBC_RF_ADMIN_climate_daily_2016-2020.csv'])
-        regress_try = RegressHelp()
-        regressor = regress_try.prepare_climate_regr(climate_data_csv, convert_day_to_hour_interval='2H',impute='mean')
-        regressor_lst = [(['MEAN_TEMPERATURE','TOTAL_PRECIPITATION'],regressor)]
-    
-        ws = trial_1.worksheet
-        nameList = list(ws)
-        nameList.remove('DateTime')
-        nameList.remove('Date')
-        nameList.remove('Time')
-        #nameList = ['W 3rd Edge MC1A (8912/19)']
-        if agg==True:
-            nameList = ['Aggregate']
-    
-        # Create prediction results DataFrame
-        df = pd.DataFrame(columns=['ds', 'yhat', 'yhat_lower', 'yhat_upper'])
-    
-        for columnName in nameList:
-            trial_1.preprocess(col_name=columnName, forecast_horizon=forecast_horizon, impute='mean', regressor_list=regressor_lst)
-
-            regressor_trans_func = {
-                'MEAN_TEMPERATURE': lambda x: x,
-                'TOTAL_PRECIPITATION': lambda x: x,
-            }
-            
-            # default using hyperparameter, otherwise set the third argument to False
-            trial_1.train_N_forecast(trial_1.train_df, forecast_params, True, regressor_list=regressor_lst, regr_future=trial_1.test_df, groundtruth=trial_1.test_df)
-           
-            # initialize list of lists
-            data = trial_1.forecast_results[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(forecast_horizon)
-            df = df.append(data, ignore_index=True)
-            forecast_groundtruth_combined_df = pd.merge(df, trial_1.test_df[['ds','y']].copy().rename(columns={'y': 'groundtruth'}), on="ds")
-            #print(df)
-            #print(forecast_groundtruth_combined_df)
-
-    
-            trial_1.plot_results(i[:-4] +' in-sample forecast results_with regr', trial_1.trained_model, trial_1.forecast_results)
-            print('This is the forecast in ' + i)
-    
-        #produce MAE sheet
-        for method, result in trial_1.eval_results_dict.items():
-            example_dict = dict({i[:-4] + '_aggr': result})
-        df_dictionary = pd.DataFrame.from_dict(example_dict,orient='index')
-        df_dictionary = df_dictionary.loc[:,~df_dictionary.columns.duplicated()].reset_index()
-        MAE_df = MAE_df.loc[:,~MAE_df.columns.duplicated()].reset_index(drop=True).append(df_dictionary)
-        #print(MAE_df)
-        
+
+    # farm the files out to worker processes; results come back in the order of fileList
+    if n_workers > 1:
+        # share the cores between the file workers and their grid searches
+        if grid_n_jobs is None:
+            grid_n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+        # build the regressor cache once, so the workers only memory-map it
+        with stage_metrics.stage('regressors'):
+            prepare_regressors()
+        # the workers log through the queue of this process, so the log file has a single writer
+        setup_logging(config.LOG_PATH, config.LOG_LEVEL)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=worker_logging, initargs=worker_logging_args()) as pool:
+            file_results = list(pool.map(forecast_file, fileList, repeat(agg), repeat(forecast_horizon), repeat(grid_n_jobs), repeat(columns), repeat(search_kwargs)))
+    else:
+        if grid_n_jobs is None:
+            grid_n_jobs = config.GRID_N_JOBS
+        file_results = [forecast_file(i, agg, forecast_horizon, grid_n_jobs, columns, search_kwargs) for i in fileList]
+
+    # plots and Excel/model files are only written here, so workers never compete for the same output file
+    for file_result in file_results:
+        i = file_result['file']
+        df = file_result['forecast_df']
+        stage_metrics.extend(file_result['stage_metrics'])
+
+        with stage_metrics.stage('save model', series=i):
+            for columnName, trained_model in file_result['trained_models'].items():
+                CLT_perform.save_model(trained_model, file_result['model_name'], i, columnName)
+        with stage_metrics.stage('plot', series=i, rows=len(file_result['forecast_results'])):
+            CLT_perform.render_forecast_plot(i[:-4] +' in-sample forecast results_with regr', file_result['history'], file_result['forecast_results'], file_result['col_name'], plots)
+
         #add forecast df to dict
         forecast_dict[i[:-4]] = df.rename(columns={'yhat': 'y'})
-        
+
         #produce prediction sheet
-        append_to_excel('Prophet\output.xlsx', forecast_groundtruth_combined_df, i[:-4] + '_aggr')
+        export.add_sheet(os.path.join('Prophet', 'output.xlsx'), i[:-4] + '_aggr', file_result['forecast_groundtruth_combined_df'])
 
-        groundtruth_dict[i[:-4]] = trial_1.test_df
-    
-    MAE_df.rename(columns = {0:'MAE'}, inplace = True)
-    append_to_excel('Prophet\Performance Metric - MAE.xlsx', MAE_df, 'Prophet MAE')
-    return MAE_df, forecast_dict, groundtruth_dict
+        groundtruth_dict[i[:-4]] = file_result['groundtruth_df']
 
+    #produce MAE sheet: every metric of every file in one pass, columns 'index' and 'MAE' first
+    forecasts = [file_result['forecast_results'] for file_result in file_results]
+    MAE_df = evaluate(
+        stack([file_result['groundtruth_df']['y'] for file_result in file_results], forecast_horizon),
+        *(stack([forecast[col] for forecast in forecasts], forecast_horizon) for col in ['yhat', 'yhat_lower', 'yhat_upper']),
+        index=[file_result['file'][:-4] + '_aggr' for file_result in file_results],
+    ).rename_axis('index').reset_index()
+    #print(MAE_df)
+    export.add_sheet(os.path.join('Prophet', 'Performance Metric - MAE.xlsx'), 'Prophet MAE', MAE_df)
+    with stage_metrics.stage('export'):
+        export.flush()
+    if own_plots:
+        with stage_metrics.stage('plot (wait)'):
+            plots.close()
+    return MAE_df, forecast_dict, groundtruth_dict
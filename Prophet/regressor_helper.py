@@ -7,6 +7,10 @@ This helper function prepares the data of regressor(s) to match the format requi
 Import libraries
 ================
 """
+import hashlib
+import json
+import os
+import numpy as np
 import pandas as pd
 from sklearn.impute import SimpleImputer
 
@@ -15,7 +19,57 @@ class RegressHelp:
 	May need to include an 'impute' method later
 	"""
 
+	# process-wide cache of prepared climate regressors: {(path, mtime, interval, impute strategy): dataframe}
+	_climate_regr_cache = {}
+
 	def prepare_climate_regr(self,raw_clmate_data, **kwargs):
+		"""
+		the prepared regressors are memoized per process, keyed by (path, mtime, interval, impute strategy)
+		Arguments
+			- kwargs['convert_day_to_hour_interval']: e.g., '2H'
+			- kwargs['impute']: strategy of sklearn SimpleImputer, e.g., 'mean'
+			- kwargs['cache_dir']: if given, the prepared regressors are also stored there as .npy files and memory-mapped read-only,
+			  so parallel workers share one copy through the OS page cache instead of each building their own
+		Returns:
+			- a dataframe shared with other callers: add/drop columns freely, but do not modify its values in place
+		"""
+		key = (os.path.abspath(raw_clmate_data), os.stat(raw_clmate_data).st_mtime_ns, kwargs.get('convert_day_to_hour_interval'), kwargs.get('impute'))
+		if key not in RegressHelp._climate_regr_cache:
+			if 'cache_dir' in kwargs:
+				RegressHelp._climate_regr_cache[key] = self._load_shared_regr(key, **kwargs)
+			else:
+				RegressHelp._climate_regr_cache[key] = self._build_climate_regr(raw_clmate_data, **kwargs)
+
+		# shallow copy: the values are shared, but callers adding columns do not change the cached frame
+		return RegressHelp._climate_regr_cache[key].copy(deep=False)
+
+	def _load_shared_regr(self, key, **kwargs):
+		"""
+		loads the regressors from the .npy files of kwargs['cache_dir'] (memory-mapped), building and writing them first if needed
+		"""
+		stem = os.path.sep.join([kwargs['cache_dir'], 'climate_regr-' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]])
+		if not os.path.exists(stem + '.meta.json'):
+			climate_regr = self._build_climate_regr(key[0], **kwargs)
+			regr_columns = [col for col in climate_regr.columns if col != 'ds']
+			os.makedirs(kwargs['cache_dir'], exist_ok=True)
+			# write to temporary names and rename, so concurrent workers never read a half-written file
+			for suffix, values in [('.index.npy', climate_regr.index.values), ('.values.npy', climate_regr[regr_columns].to_numpy(dtype=np.float64))]:
+				with open(f"{stem}{suffix}.{os.getpid()}.tmp", 'wb') as fout:
+					np.save(fout, values)
+				os.replace(f"{stem}{suffix}.{os.getpid()}.tmp", stem + suffix)
+			with open(f"{stem}.meta.json.{os.getpid()}.tmp", 'w') as fout:
+				json.dump({'key': repr(key), 'columns': regr_columns, 'index_name': climate_regr.index.name}, fout)
+			os.replace(f"{stem}.meta.json.{os.getpid()}.tmp", stem + '.meta.json')
+
+		with open(stem + '.meta.json', 'r') as fin:
+			meta = json.load(fin)
+		index = pd.DatetimeIndex(np.load(stem + '.index.npy'), name=meta['index_name'])
+		climate_regr = pd.DataFrame(np.load(stem + '.values.npy', mmap_mode='r'), index=index, columns=meta['columns'], copy=False)
+		# create a "ds" column
+		climate_regr['ds'] = climate_regr.index
+		return climate_regr
+
+	def _build_climate_regr(self,raw_clmate_data, **kwargs):
 		# load climate data
 		raw_climate_data = pd.read_csv(raw_clmate_data, parse_dates=['LOCAL_DATE'])
 		retained_climate_data = raw_climate_data[['LOCAL_DATE', 'MEAN_TEMPERATURE','TOTAL_PRECIPITATION']]
@@ -9,8 +9,7 @@ Author: Leo Sun, Manqin Cai
 Import libraries
 ================
 """
-import matplotlib.pyplot as plt
-import os
+from plot_helper import PlotHelp
 
 class Results_Analysis:
 
@@ -20,9 +19,13 @@ class Results_Analysis:
         self.Prophet_forecast_results_dict = kwargs['forecast_dict']
         #self.Darts_forecast_results_dict = kwargs['forecasts_all_dict']
         self.groundtruth_dict = kwargs['groundtruth_dict']
+        # figures are rendered in the background by 'plots' (see plot_helper.py), call close() to wait for them
+        self.plots = kwargs['plots'] if 'plots' in kwargs else PlotHelp()
+
+    def close(self):
+        self.plots.close()
 
     def MAE_Line_Plot(self, **kwargs):
-        plt.figure(figsize=(10, 8))
         MAE_all_dict = self.Darts_MAE_dict
         MAE_all_dict["Prophet"] =  []
         
@@ -32,6 +35,7 @@ class Results_Analysis:
 
         print(MAE_all_dict)
 
+        lines = []
         for mae in MAE_all_dict:               
             MAE_floor_list = []
             MAE_value_list = []
@@ -41,14 +45,9 @@ class Results_Analysis:
                 MAE_floor_list.append(floor)
                 MAE_value_list.append(val)
             
-            plt.plot(MAE_floor_list, MAE_value_list,label=mae)
+            lines.append((mae, MAE_floor_list, MAE_value_list))
             
-        plt.xlabel("floor")
-        plt.ylabel("MAE")
-        plt.legend(loc='best')
-        plt.tight_layout()
-        plt.savefig(os.path.sep.join([kwargs['output_path'],'{}.png'.format("MAE")]), dpi=600)
-        plt.show()
+        self.plots.line_plot(kwargs['output_path'], "MAE", lines, "floor", "MAE")
 
     def Forecasts_Line_Plot(self, **kwargs):
         '''
@@ -81,23 +80,17 @@ class Results_Analysis:
 
 '''
 #   only for Prophet forecast visualization, delete below if needed
-        plt.figure(figsize=(10, 8))
-    
+        # one figure per file
         for fkey, results_df in self.Prophet_forecast_results_dict.items():
-            plt.plot(self.groundtruth_dict[fkey]['ds'], self.groundtruth_dict[fkey]['y'], label = 'groundtruth') 
-            plt.plot(results_df['ds'], results_df['y'], label = 'yhat')
-            plt.plot(results_df['ds'], results_df['yhat_lower'], label = 'yhat_lower')
-            plt.plot(results_df['ds'], results_df['yhat_upper'], label = 'yhat_upper')
-            plt.xticks(rotation ='vertical')
-            plt.fill_between(results_df['ds'], results_df['yhat_lower'], results_df['yhat_upper'], color='y', alpha=.5)
+            lines = [('groundtruth', self.groundtruth_dict[fkey]['ds'], self.groundtruth_dict[fkey]['y'])]
+            for col, label in [('y', 'yhat'), ('yhat_lower', 'yhat_lower'), ('yhat_upper', 'yhat_upper')]:
+                lines.append((label, results_df['ds'], results_df[col]))
+            band = (results_df['ds'], results_df['yhat_lower'], results_df['yhat_upper'])
     
             #groundtruth to add
-            plt.xlabel("timestamp" + " (" + str(results_df['ds'][0]) + " - " + str(results_df['ds'].iloc[-1]) + ")")
-            plt.ylabel("Moisture Level (%) or Vertical Movement (mm)")
-            plt.legend(loc='best')
-            plt.tight_layout()
-            plt.savefig(os.path.sep.join([kwargs['output_path'], str(fkey) + " future forecasts.png"]), dpi=600)
-            plt.show()
+            xlabel = "timestamp" + " (" + str(results_df['ds'].iloc[0]) + " - " + str(results_df['ds'].iloc[-1]) + ")"
+            self.plots.line_plot(kwargs['output_path'], str(fkey) + " future forecasts", lines, xlabel, "Moisture Level (%) or Vertical Movement (mm)",
+                                 band=band, rotate_xticks=True)
   
     
 
@@ -0,0 +1,170 @@
+"""
+This helper caches the outputs of pipeline stages on disk, keyed by a hash of their inputs (content-addressed):
+    - a key is the sha1 of the stage name, its inputs (dataframes, arrays, parameter dicts, ...) and a salt, typically the versions of the
+      libraries and a digest of the code of the stage, so a change of any of them misses the cache instead of loading a stale output
+    - an interrupted or repeated run loads the outputs of the stages already done instead of computing them again
+    - entries are pickle files, written atomically, so the worker processes of a run can share the cache
+    - the cache is bounded: above max_mb, the least recently used entries (oldest file mtime, refreshed on every hit) are evicted
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+
+
+def library_versions(*names):
+    """
+    {distribution name: installed version}, None if not installed
+    """
+    versions = {}
+    for name in names:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def source_digest(*paths):
+    """
+    sha1 of the content of source files, e.g. the module of a stage, to tell its cached outputs apart once the code is edited
+    """
+    sha1 = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as fin:
+            sha1.update(fin.read())
+    return sha1.hexdigest()
+
+
+def hash_input(sha1, obj):
+    """
+    feeds obj into the hash sha1; dataframes and arrays are hashed by content, containers recursively
+    raises TypeError for anything else (e.g. functions), rather than hashing it by identity
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes, np.generic)):
+        sha1.update(f"{type(obj).__name__}:{obj!r};".encode('utf-8'))
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        frame = obj.to_frame() if isinstance(obj, pd.Series) else obj
+        sha1.update(f"{type(obj).__name__}:{frame.shape}:".encode('utf-8'))
+        hash_input(sha1, [str(name) for name in frame.columns] + [str(dtype) for dtype in frame.dtypes])
+        sha1.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        sha1.update(f"ndarray:{obj.dtype}:{obj.shape}:".encode('utf-8'))
+        sha1.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        sha1.update(f"dict:{len(obj)}:".encode('utf-8'))
+        for key in sorted(obj, key=repr):
+            hash_input(sha1, key)
+            hash_input(sha1, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        sha1.update(f"{type(obj).__name__}:{len(obj)}:".encode('utf-8'))
+        for item in obj:
+            hash_input(sha1, item)
+    else:
+        raise TypeError(f"cannot hash an input of type {type(obj).__name__}")
+
+
+class ArtifactCache:
+    """
+    Arguments:
+        - cache_dir: folder of the entries
+        - max_mb: size of the cache above which the least recently used entries are evicted
+        - salt: anything hash_input accepts, mixed into every key (e.g. library versions and code digest)
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_dir, max_mb=2048, salt=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 2**20
+        self.salt = salt
+
+    def key(self, stage, *inputs):
+        """
+        the key of the output of 'stage' computed from 'inputs'; raises TypeError if an input cannot be hashed
+        """
+        sha1 = hashlib.sha1()
+        hash_input(sha1, [self.CACHE_VERSION, stage, self.salt, list(inputs)])
+        return sha1.hexdigest()
+
+    def path(self, key):
+        return os.path.sep.join([self.cache_dir, key[:2], key + '.pkl'])
+
+    def get(self, key):
+        """
+        the cached output, or None on a miss (unreadable entries are removed and count as misses)
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fin:
+                value = pickle.load(fin)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            self._remove(path)
+            return None
+        # a hit is a use: keep the entry away from eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        stores 'value' (not None) under 'key', then evicts the least recently used entries if the cache is over its size
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so a crash (or another process) never sees half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                pickle.dump(value, fout, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def entries(self):
+        """
+        [(last use, size in bytes, path)] of every entry
+        """
+        entries = []
+        for sub_dir in os.scandir(self.cache_dir):
+            if sub_dir.is_dir():
+                for entry in os.scandir(sub_dir.path):
+                    if entry.name.endswith('.pkl'):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,65 @@
+"""
+This helper backtests a forecasting model on rolling origins, shared by the Prophet and Darts paths:
+    - cutoffs walk back from the end of the series every 'period' rows, as long as 'initial' rows are left to train on
+    - for every cutoff, the model is fitted on the rows before it and forecasts the next 'horizon' rows
+    - cutoffs are fitted concurrently on a process pool; data shared by every cutoff (e.g. aligned regressors) is prepared once by the caller
+    - the result has one row per cutoff and horizon step, so errors can be aggregated per step, per cutoff or overall
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from log_helper import worker_logging, worker_logging_args
+
+
+def rolling_origin_cutoffs(n_rows, initial, period, horizon):
+    """
+    positions of the cutoffs (first row of each forecast window), oldest first; the last window ends on the last row
+    """
+    if initial + horizon > n_rows:
+        raise ValueError(f"{n_rows} rows are not enough for an initial window of {initial} rows and a horizon of {horizon} rows")
+    return list(range(n_rows - horizon, initial - 1, -period))[::-1]
+
+
+def run_backtest(forecast_cutoff, ds, y, cutoffs, horizon, n_jobs=None):
+    """
+    Arguments:
+        - forecast_cutoff: forecast_cutoff(cutoff) fits on the rows before 'cutoff' and returns 'horizon' forecast values;
+          a module-level function (or a partial of one), so it can be sent to worker processes
+        - ds, y: timestamps and actual values of the whole series, positions match the cutoffs
+        - n_jobs: number of worker processes (None = all cores, 1 = serial)
+    Returns:
+        - a df('cutoff', 'step', 'ds', 'y', 'yhat', 'error'), 'cutoff' being the last timestamp of the training rows
+    """
+    if n_jobs == 1:
+        forecasts = list(map(forecast_cutoff, cutoffs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs or os.cpu_count(), len(cutoffs)), initializer=worker_logging, initargs=worker_logging_args()) as pool:
+            forecasts = list(pool.map(forecast_cutoff, cutoffs))
+
+    ds, y = np.asarray(ds), np.asarray(y, dtype=float)
+    rows = np.concatenate([np.arange(cutoff, cutoff + horizon) for cutoff in cutoffs])
+    yhat = np.concatenate([np.asarray(forecast, dtype=float)[:horizon] for forecast in forecasts])
+    return pd.DataFrame({
+        'cutoff': np.repeat(ds[np.array(cutoffs) - 1], horizon),
+        'step': np.tile(np.arange(1, horizon + 1), len(cutoffs)),
+        'ds': ds[rows],
+        'y': y[rows],
+        'yhat': yhat,
+        'error': yhat - y[rows],
+    })
+
+
+def horizon_errors(backtest_results):
+    """
+    MAE per horizon step over all cutoffs
+    """
+    return backtest_results['error'].abs().groupby(backtest_results['step']).mean().rename('MAE')
@@ -0,0 +1,111 @@
+"""
+This helper prepares several sensor columns of a worksheet at once, shared by the Prophet and Darts pipelines (CLT_perform, Darts_CLT_Perform):
+    - the valid range of every column is found, and imputed, as one 2-D operation
+    - regressors are aligned to the worksheet once per file, not once per column
+    - the train/test data of one column are numpy views of the prepared arrays until the column is selected
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+
+from metrics_helper import stage_metrics
+
+
+class BatchHelp:
+    """
+    base class of the pipeline classes: expects self.worksheet (see ingest_helper.Worksheet) and self.logger
+    """
+
+    def preprocess_batch(self, col_names, in_sample_forecast=True, forecast_horizon=None, **kwargs):
+        """
+        same as preprocess, but for several columns of the worksheet at once (e.g., agg=False runs):
+            - the valid range of every column is found, and imputed, as one 2-D operation
+            - regressors are aligned to the worksheet once per file
+        call select_column(col_name) afterwards to get self.train_df (and self.test_df) of one column, like preprocess does
+        columns without any valid data are logged and left out of self.batch_columns
+        [caution] 'DateTime' must be sorted, as it is in the sensor exports
+        """
+        values = self.worksheet.take(col_names, dtype=float)
+        valid = ~np.isnan(values)
+        has_data = valid.any(axis=0)
+        for col_name in np.array(col_names)[~has_data]:
+            self.logger.warning(f"{col_name} column has no valid data, skipped")
+        self.batch_columns = [col_name for (col_name, keep) in zip(col_names, has_data) if keep]
+        self.batch_spans = {}
+        if not self.batch_columns:
+            return
+        values, valid = values[:, has_data], valid[:, has_data]
+
+        # determine first and last valid index of every column
+        first_valid_idx = valid.argmax(axis=0)
+        last_valid_idx = len(values) - 1 - valid[::-1].argmax(axis=0)
+
+        # check if impute is intended for ALL data; only NaN lies outside the valid ranges, so the column statistics are the same as in preprocess
+        if 'impute' in kwargs:
+            values = SimpleImputer(strategy=kwargs['impute']).fit_transform(values)
+
+        # align each regressor once: which rows of the worksheet have a regressor timestamp
+        ds = self.worksheet.index.values
+        regressors = []
+        if 'regressor_list' in kwargs:
+            with stage_metrics.stage('regressor alignment', rows=len(ds)):
+                for (regressor_name_lst, regressor_df) in kwargs['regressor_list']:
+                    in_regr = np.isin(ds, regressor_df.index.values)
+                    regressors.append((regressor_name_lst, regressor_df, in_regr))
+
+        self.batch_ds, self.batch_values = ds, values
+        self.batch_in_sample, self.batch_forecast_horizon = in_sample_forecast, forecast_horizon
+        for j, col_name in enumerate(self.batch_columns):
+            self.logger.info(f"==== statistics of {col_name} column ====")
+            self.logger.info(f"idx of the FIRST valid cell is: {first_valid_idx[j]}")
+            self.logger.info(f"idx of the LAST valid cell is: {last_valid_idx[j]}")
+            self.logger.info(" ")
+
+            # narrow the range to the common timesteps of every regressor, as RegressHelp.matching_regr_data does
+            start, stop = first_valid_idx[j], last_valid_idx[j] + 1
+            regr_columns = [] # [(regressor_name, values, worksheet row of values[0])]
+            for (regressor_name_lst, regressor_df, in_regr) in regressors:
+                common_rows = np.flatnonzero(in_regr[start:stop]) + start
+                if len(common_rows) == 0:
+                    raise ValueError(f"{col_name} column has no timestep in common with regressors {regressor_name_lst}")
+                start, stop = common_rows[0], common_rows[-1] + 1
+                regr_start = regressor_df.index.searchsorted(ds[start], side='left')
+                regr_stop = regressor_df.index.searchsorted(ds[stop - 1], side='right')
+                if regr_stop - regr_start != stop - start:
+                    raise ValueError(f"Length of values ({regr_stop - regr_start}) does not match length of index ({stop - start})")
+                for regressor_name in regressor_name_lst:
+                    regr_columns.append((regressor_name, regressor_df[regressor_name].values[regr_start:regr_stop], start))
+
+            # numpy slices are views, so no column data is copied until select_column
+            self.batch_spans[col_name] = (j, start, stop, [(regressor_name, regr_values[start - regr_row:stop - regr_row]) for (regressor_name, regr_values, regr_row) in regr_columns])
+
+    def select_column(self, col_name):
+        """
+        sets self.data_for_anal and self.train_df (and self.test_df, if in-sample forecast) of ONE column prepared by preprocess_batch
+        """
+        # store column name for plot use
+        self.col_name = col_name
+        j, start, stop, regr_columns = self.batch_spans[col_name]
+
+        data = {'ds': self.batch_ds[start:stop], 'y': self.batch_values[start:stop, j]}
+        for (regressor_name, regr_values) in regr_columns:
+            data[regressor_name] = regr_values
+        # same index as preprocess: timestamps once matched with regressors, worksheet rows otherwise
+        if regr_columns:
+            index = pd.DatetimeIndex(data['ds'], name='INDEX')
+        else:
+            index = pd.RangeIndex(start, stop)
+        self.data_for_anal = pd.DataFrame(data, index=index)
+
+        # prepare training and test data (row slices of data_for_anal: copy() them before adding columns)
+        if self.batch_in_sample:
+            self.train_df = self.data_for_anal.iloc[:-self.batch_forecast_horizon]
+            self.test_df =  self.data_for_anal.iloc[-self.batch_forecast_horizon:]
+        else:
+            self.train_df = self.data_for_anal
@@ -0,0 +1,188 @@
+"""
+This script times the main steps of the Prophet pipeline on synthetic datasheets of several sizes (see synthetic_data.py):
+    - CLT_perform.__init__ (with and without the ingest cache, and in streaming mode), CLT_perform.preprocess
+    - RegressHelp.prepare_climate_regr, RegressHelp.matching_regr_data
+    - a single Prophet fit (fit_predict) and FB_prophet_train_forecast.eval_model
+Every benchmark reports the best and the median of 'repeat' runs. The results are stored as json in benchmarks/results,
+named after the current commit, so runs of two commits can be compared:
+    python benchmarks/run_benchmarks.py --sizes small medium
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.sep.join([REPO_PATH, 'benchmarks', 'results'])
+sys.path.insert(0, REPO_PATH)
+
+import Prophet.brock_comm_config as config
+from Prophet.brock_comm_CLT_perform import CLT_perform
+from Prophet.regressor_helper import RegressHelp
+from Prophet.fb_prophet_train_forecast import FB_prophet_train_forecast, fit_predict
+from benchmarks.synthetic_data import write_sensor_sheet, write_climate_data
+
+# (number of sensor columns, number of 2-hourly rows); 'medium' is about the size of one Brock Commons export
+# [caution] summer readings are on odd local hours, off the 2-hour grid of the climate regressors, so every size must span a winter
+SIZES = {
+    'small': (4, 4000),
+    'medium': (14, 17000),
+    'large': (40, 50000),
+}
+FORECAST_HORIZON = 300
+# a regression larger than this ratio of the old best time is flagged by --compare
+REGRESSION_RATIO = 1.2
+
+
+def timeit(func, repeat, setup=None):
+    """
+    returns the run times of func() in seconds; setup() runs before every call and is not timed, its result is passed to func
+    """
+    times = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def benchmark_size(size_name, repeat, prophet_repeat):
+    """
+    writes the synthetic datasheets of one size into a temporary folder and times every step on them
+    """
+    n_columns, n_rows = SIZES[size_name]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_sensor_sheet(os.path.sep.join([tmp_dir, 'Synthetic.csv']), n_columns, n_rows)
+        climate_data_csv = os.path.sep.join([tmp_dir, 'climate.csv'])
+        write_climate_data(climate_data_csv, n_rows // 12 + 2)
+
+        # CLT_perform reads config paths relative to the working folder, and logs into it
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        config.DATASHEETS_PATH = '.'
+        try:
+            config.INGEST_CACHE_PATH = None
+            results['CLT_perform.__init__'] = timeit(lambda: CLT_perform('Synthetic.csv', True), repeat)
+            config.INGEST_CACHE_PATH = 'ingest_cache'
+            CLT_perform('Synthetic.csv', True)
+            results['CLT_perform.__init__ (cached)'] = timeit(lambda: CLT_perform('Synthetic.csv', True), repeat)
+            config.INGEST_STREAMING = True
+            results['CLT_perform.__init__ (streaming)'] = timeit(lambda: CLT_perform('Synthetic.csv', True), repeat)
+            config.INGEST_STREAMING = False
+
+            def build_regressor():
+                RegressHelp._climate_regr_cache.clear()
+                return RegressHelp().prepare_climate_regr(climate_data_csv, convert_day_to_hour_interval='2H', impute='mean')
+            results['RegressHelp.prepare_climate_regr'] = timeit(build_regressor, repeat)
+            regressor = build_regressor()
+            regressor_lst = [(['MEAN_TEMPERATURE', 'TOTAL_PRECIPITATION'], regressor)]
+
+            trial = CLT_perform('Synthetic.csv', True)
+            results['CLT_perform.preprocess'] = timeit(lambda: trial.preprocess('Aggregate', forecast_horizon=FORECAST_HORIZON, impute='mean'), repeat)
+            results['CLT_perform.preprocess (regressors)'] = timeit(lambda: trial.preprocess('Aggregate', forecast_horizon=FORECAST_HORIZON, impute='mean', regressor_list=regressor_lst), repeat)
+
+            # matching_regr_data changes the index of the series it is given, so every run gets a fresh copy
+            ts_data = trial.worksheet[['DateTime', 'Aggregate']].rename(columns={'DateTime': 'ds', 'Aggregate': 'y'})
+            results['RegressHelp.matching_regr_data'] = timeit(lambda ts_copy: RegressHelp().matching_regr_data(regressor, ts_copy), repeat, setup=ts_data.copy)
+
+            trial.preprocess('Aggregate', forecast_horizon=FORECAST_HORIZON, impute='mean', regressor_list=regressor_lst)
+            p = {'changepoint_prior_scale': 0.05, 'seasonality_prior_scale': 1.0, 'seasonality_mode': 'additive'}
+            forecast_params = {'periods': FORECAST_HORIZON, 'freq': '2H'}
+            future_regr = FB_prophet_train_forecast().prepare_future_regr(trial.train_df, forecast_params, ['MEAN_TEMPERATURE', 'TOTAL_PRECIPITATION'], regr_future=trial.test_df)
+            fit = lambda: fit_predict(p, trial.train_df, forecast_params, ['MEAN_TEMPERATURE', 'TOTAL_PRECIPITATION'], future_regr)
+            results['Prophet fit_predict'] = timeit(fit, prophet_repeat)
+
+            m, forecast = fit()
+            # eval_model reads the horizon set by train_forecast
+            evaluator = FB_prophet_train_forecast()
+            evaluator.forecast_horizon = FORECAST_HORIZON
+            results['FB_prophet_train_forecast.eval_model'] = timeit(lambda: evaluator.eval_model(trial.test_df, forecast), repeat)
+        finally:
+            os.chdir(cwd)
+
+    return [{
+        'benchmark': name,
+        'size': size_name,
+        'n_columns': n_columns,
+        'n_rows': n_rows,
+        'best': min(times),
+        'median': float(np.median(times)),
+        'repeat': len(times),
+    } for name, times in results.items()]
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_PATH, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(sizes, repeat, prophet_repeat):
+    commit = current_commit()
+    results = {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': [],
+    }
+    for size_name in sizes:
+        for row in benchmark_size(size_name, repeat, prophet_repeat):
+            print(f"{row['size']:>7} {row['benchmark']:<40} best {row['best']:9.4f}s  median {row['median']:9.4f}s")
+            results['results'].append(row)
+
+    os.makedirs(RESULTS_PATH, exist_ok=True)
+    results_json = os.path.sep.join([RESULTS_PATH, f"{commit}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"])
+    with open(results_json, 'w') as fout:
+        json.dump(results, fout, indent=1)
+    print('Results saved to ' + results_json)
+
+
+def compare(old_json, new_json):
+    """
+    prints the ratio of the best times (new / old) of the benchmarks found in both result files
+    """
+    with open(old_json, 'r') as fin:
+        old = json.load(fin)
+    with open(new_json, 'r') as fin:
+        new = json.load(fin)
+    old_best = {(row['benchmark'], row['size']): row['best'] for row in old['results']}
+    print(f"{old['commit']} -> {new['commit']}")
+    for row in new['results']:
+        key = (row['benchmark'], row['size'])
+        if key in old_best:
+            ratio = row['best'] / old_best[key]
+            flag = '  <-- slower' if ratio > REGRESSION_RATIO else ''
+            print(f"{row['size']:>7} {row['benchmark']:<40} {old_best[key]:9.4f}s -> {row['best']:9.4f}s  x{ratio:5.2f}{flag}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the Prophet pipeline steps on synthetic datasheets')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--prophet-repeat', type=int, default=2, help='repeats of the (slow) Prophet fit')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD_JSON', 'NEW_JSON'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args.sizes, args.repeat, args.prophet_repeat)
@@ -0,0 +1,84 @@
+"""
+This script generates synthetic datasheets with the same layout as the Brock Commons exports, for benchmarking:
+    - sensor sheets: a 'DateTime' column in local time with the UTC offset suffix ('2016-04-30 23:00:00-0700', '-0800' in winter),
+      followed by N sensor columns of 2-hourly readings; missing readings are written as ' NULL ', like the exports
+    - climate data: daily 'LOCAL_DATE', 'MEAN_TEMPERATURE' and 'TOTAL_PRECIPITATION' columns, like the Haney UBC RF ADMIN csv
+
+To write one sensor sheet:
+    python benchmarks/synthetic_data.py <csv path> <n_columns> <n_rows>
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+# first reading of the exports
+START = '2016-04-30 23:00:00'
+TIMEZONE = 'America/Vancouver'
+
+
+def sensor_timestamps(n_rows, freq='2H'):
+    """
+    local timestamps of the exports: a regular grid in UTC, so readings move by an hour at every DST change
+    """
+    utc = pd.date_range(pd.Timestamp(START, tz=TIMEZONE).tz_convert('UTC'), periods=n_rows, freq=freq)
+    return utc.tz_convert(TIMEZONE).strftime('%Y-%m-%d %H:%M:%S%z')
+
+
+def sensor_values(n_columns, n_rows, null_fraction=0.05, seed=0):
+    """
+    one random walk with daily and yearly cycles per column, every column starts after a run of missing readings
+    (sensors were installed at different times), and a fraction of the remaining readings is missing
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.arange(n_rows) * 2
+    cycles = 0.05 * np.sin(2 * np.pi * hours / 24) + 0.2 * np.sin(2 * np.pi * hours / (24 * 365.25))
+    values = rng.normal(scale=0.01, size=(n_rows, n_columns)).cumsum(axis=0) + cycles[:, None] + rng.uniform(-1, 1, n_columns)
+
+    first_reading = rng.integers(0, max(1, n_rows // 10), n_columns)
+    values[np.arange(n_rows)[:, None] < first_reading] = np.nan
+    values[rng.random((n_rows, n_columns)) < null_fraction] = np.nan
+    return values
+
+
+def write_sensor_sheet(path, n_columns, n_rows, null_fraction=0.05, seed=0):
+    """
+    write a sensor csv with the header, padding and 'NULL' cells of the exports
+    """
+    values = sensor_values(n_columns, n_rows, null_fraction, seed)
+    cells = np.where(np.isnan(values), ' NULL ', np.char.mod('%.7g', values))
+    timestamps = np.asarray(sensor_timestamps(n_rows), dtype=object)
+
+    header = ' , '.join(['DateTime'] + [f"Floor {k // 2 + 2} Sensor {k % 2 + 1} ({8900 + k}/{k % 30})" for k in range(n_columns)]) + ' '
+    with open(path, 'w', newline='') as fout:
+        fout.write(header + '\r\n')
+        for timestamp, row in zip(timestamps, cells):
+            fout.write(timestamp + ',' + ','.join(row) + '\r\n')
+
+
+def write_climate_data(path, n_days, seed=0):
+    """
+    write a daily climate csv covering n_days from the first sensor reading, with a few missing days
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(pd.Timestamp(START).normalize(), periods=n_days, freq='D')
+    mean_temperature = 10 + 8 * np.sin(2 * np.pi * (days.dayofyear.values - 110) / 365.25) + rng.normal(scale=2, size=n_days)
+    total_precipitation = rng.gamma(0.6, 8, size=n_days) * (rng.random(n_days) < 0.5)
+    climate_data = pd.DataFrame({
+        'STATION_NAME': 'SYNTHETIC',
+        'LOCAL_DATE': days.strftime('%Y-%m-%d'),
+        'MEAN_TEMPERATURE': mean_temperature.round(1),
+        'TOTAL_PRECIPITATION': total_precipitation.round(1),
+    })
+    climate_data.loc[rng.random(n_days) < 0.02, ['MEAN_TEMPERATURE', 'TOTAL_PRECIPITATION']] = np.nan
+    climate_data.to_csv(path, index=False)
+
+
+if __name__ == '__main__':
+    write_sensor_sheet(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
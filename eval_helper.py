@@ -0,0 +1,59 @@
+"""
+This helper evaluates forecasts of many series (files, columns, models) at once, shared by the Prophet and Darts pipelines:
+    - forecasts and groundtruth are stacked into 2-D arrays, one row per series and one column per horizon step
+    - every metric is computed for every row in one vectorized pass: MAE, RMSE, MAPE, sMAPE, bias and interval coverage
+    - the result is a tidy table, one row per series (or per horizon step) and one column per metric
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import numpy as np
+import pandas as pd
+
+METRICS = ['MAE', 'RMSE', 'MAPE', 'sMAPE', 'Bias', 'Coverage']
+
+
+def evaluate(y, yhat, yhat_lower=None, yhat_upper=None, index=None, axis=1):
+    """
+    Arguments:
+        - y, yhat: arrays of shape (n_series, horizon), a 1-D array is one series; NaN groundtruth is left out
+        - yhat_lower, yhat_upper: prediction interval of the same shape; 'Coverage' (share of y inside it) is NaN without them
+        - index: labels of the result rows (series with axis=1, horizon steps with axis=0)
+        - axis: 1 = one result row per series (over its horizon), 0 = one result row per horizon step (over all series)
+    Returns:
+        - a df with one column per metric; MAPE and sMAPE are in %, Bias is mean(yhat - y)
+    """
+    y, yhat = np.atleast_2d(np.asarray(y, dtype=float)), np.atleast_2d(np.asarray(yhat, dtype=float))
+    valid = ~np.isnan(y)
+    n_valid = valid.sum(axis=axis)
+    error = np.where(valid, yhat - y, 0)
+    abs_error = np.abs(error)
+
+    # percentage errors are undefined where the groundtruth (or both values) is 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ape = np.where(valid & (y != 0), abs_error / np.abs(y), np.nan)
+        sape = np.where(valid & (np.abs(y) + np.abs(yhat) != 0), 2 * abs_error / (np.abs(y) + np.abs(yhat)), np.nan)
+        results = {
+            'MAE': abs_error.sum(axis=axis) / n_valid,
+            'RMSE': np.sqrt((error**2).sum(axis=axis) / n_valid),
+            'MAPE': 100 * np.nansum(ape, axis=axis) / (~np.isnan(ape)).sum(axis=axis),
+            'sMAPE': 100 * np.nansum(sape, axis=axis) / (~np.isnan(sape)).sum(axis=axis),
+            'Bias': error.sum(axis=axis) / n_valid,
+        }
+        if yhat_lower is not None and yhat_upper is not None:
+            inside = (y >= np.atleast_2d(yhat_lower)) & (y <= np.atleast_2d(yhat_upper))
+            results['Coverage'] = (inside & valid).sum(axis=axis) / n_valid
+        else:
+            results['Coverage'] = np.full(len(n_valid), np.nan)
+
+    return pd.DataFrame(results, columns=METRICS, index=index)
+
+
+def stack(arrays, horizon):
+    """
+    stack the last 'horizon' values of several 1-D arrays (e.g. the forecast column of several forecast dfs) into a (n_series, horizon) array
+    """
+    return np.vstack([np.asarray(array, dtype=float)[-horizon:] for array in arrays])
@@ -0,0 +1,120 @@
+"""
+This helper collects the result sheets of the Prophet and Darts pipelines and writes them out once, at the end of a run:
+    - sheets are buffered in memory per workbook, so each workbook is opened and written a single time (not once per sheet)
+    - optionally the sheets go to a columnar store instead (one Parquet file per sheet + a json manifest per workbook),
+      and the Excel workbooks are generated from that store on demand
+
+To rebuild the Excel workbooks from a store:
+    python export_helper.py <store_path>
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import json
+import os
+import re
+import sys
+
+import pandas as pd
+
+
+class ExportHelp:
+    """
+    Arguments:
+        - store_path: folder of the Parquet result store; sheets are written straight to Excel if None
+        - excel: with a store, also generate the Excel workbooks from it when flushing
+    """
+
+    MANIFEST_NAME = 'manifest.json'
+
+    def __init__(self, store_path=None, excel=True):
+        self.store_path = store_path
+        self.excel = excel
+        # {workbook path: {sheet name: dataframe}}, in the order the sheets were added
+        self.workbooks = {}
+
+    def add_sheet(self, fpath, sheet_name, df):
+        """
+        buffer one sheet; adding a sheet name twice keeps the last one (like if_sheet_exists='replace')
+        """
+        self.workbooks.setdefault(fpath, {})[sheet_name] = df
+
+    def flush(self):
+        """
+        write every buffered workbook in one pass, then empty the buffer
+        """
+        for fpath, sheets in self.workbooks.items():
+            if self.store_path is None:
+                self.write_excel(fpath, sheets)
+            else:
+                self.write_store(fpath, sheets)
+                if self.excel:
+                    self.write_excel(fpath, self.read_store(self.workbook_dir(fpath))[1])
+        self.workbooks = {}
+
+    def write_excel(self, fpath, sheets):
+        """
+        write all sheets with one ExcelWriter; sheets already in an existing workbook but not in 'sheets' are kept
+        """
+        if os.path.exists(fpath):
+            writer = pd.ExcelWriter(fpath, engine='openpyxl', mode='a', if_sheet_exists='replace')
+        else:
+            writer = pd.ExcelWriter(fpath, engine='openpyxl', mode='w')
+        with writer as f:
+            for sheet_name, df in sheets.items():
+                df.to_excel(f, sheet_name=sheet_name)
+
+    def workbook_dir(self, fpath):
+        # one folder per workbook path, not per file name: 'Prophet/output.xlsx' and 'Darts/output.xlsx' -> 'Prophet__output', 'Darts__output'
+        # paths may be written with either separator ('Prophet\output.xlsx' on Windows), so split on both; drive colons are dropped
+        parts = [part.replace(':', '') for part in re.split(r'[\\/]', os.path.splitext(fpath)[0]) if part not in ('', '.')]
+        return os.path.sep.join([self.store_path, '__'.join(parts)])
+
+    def write_store(self, fpath, sheets):
+        """
+        write one Parquet file per sheet; the manifest maps sheet names (which may hold any character) to the files
+        """
+        workbook_dir = self.workbook_dir(fpath)
+        os.makedirs(workbook_dir, exist_ok=True)
+        manifest_path = os.path.sep.join([workbook_dir, self.MANIFEST_NAME])
+        try:
+            with open(manifest_path, 'r') as fin:
+                manifest = json.load(fin)
+        except (OSError, ValueError):
+            manifest = {'workbook': fpath, 'sheets': {}}
+
+        for sheet_name, df in sheets.items():
+            file_name = manifest['sheets'].get(sheet_name, f"sheet_{len(manifest['sheets']):04d}.parquet")
+            df.to_parquet(os.path.sep.join([workbook_dir, file_name]))
+            manifest['sheets'][sheet_name] = file_name
+
+        # write the manifest last, so a sheet is only listed once its file is complete
+        with open(manifest_path, 'w') as fout:
+            json.dump(manifest, fout, indent=1)
+
+    def read_store(self, workbook_dir):
+        """
+        returns (workbook path, {sheet name: dataframe}) of one workbook in the store
+        """
+        with open(os.path.sep.join([workbook_dir, self.MANIFEST_NAME]), 'r') as fin:
+            manifest = json.load(fin)
+        sheets = {sheet_name: pd.read_parquet(os.path.sep.join([workbook_dir, file_name])) for sheet_name, file_name in manifest['sheets'].items()}
+        return manifest['workbook'], sheets
+
+    def export_excel(self):
+        """
+        generate the Excel workbook of every workbook in the store
+        """
+        for workbook_name in sorted(os.listdir(self.store_path)):
+            workbook_dir = os.path.sep.join([self.store_path, workbook_name])
+            if os.path.exists(os.path.sep.join([workbook_dir, self.MANIFEST_NAME])):
+                fpath, sheets = self.read_store(workbook_dir)
+                self.write_excel(fpath, sheets)
+                print('Exported ' + fpath)
+
+
+if __name__ == '__main__':
+    ExportHelp(store_path=sys.argv[1]).export_excel()
@@ -0,0 +1,319 @@
+"""
+This service answers on-demand forecasts of the trained models, without running Master.py (which refits everything):
+    - the models are the ones saved to the model registries of the Prophet and Darts pipelines (see registry_helper.py);
+      a model is loaded on its first request and kept warm in memory, until a newer model of the same series is saved
+    - concurrent requests for the same model are batched: the first one waits 'batch_window' seconds for the others,
+      then ONE predict call forecasts the longest horizon asked and every request gets its own steps of it
+    - recent forecasts are cached, and a shorter horizon is sliced from a cached longer one; the cache of a model is dropped
+      when new data arrives (a newer model is saved, or its sensor file changes)
+    - it listens on the local interface only; 'ForecastService.forecast' gives the same answers in-process
+
+To start it, then query it with a local client:
+    python forecast_service.py --port 8050
+    curl "http://127.0.0.1:8050/forecast?file=String%20Pots.csv&column=Aggregate&model=prophet&steps=24"
+    curl "http://127.0.0.1:8050/models"
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import Darts.brock_comm_config as darts_config
+import Prophet.brock_comm_config as config
+from registry_helper import ModelRegistry
+
+HOST = '127.0.0.1'
+PORT = 8050
+# seconds the first request of a batch waits for the other requests of the same model
+BATCH_WINDOW = 0.01
+# forecasts kept in the response cache, and models kept in memory
+CACHE_SIZE = 256
+MAX_MODELS = 32
+
+
+def history_freq(ds):
+    """
+    sampling step of a 'ds' column, as a Timedelta: the most common step between consecutive timestamps
+    """
+    steps = np.diff(pd.DatetimeIndex(ds).values)
+    values, counts = np.unique(steps[steps > np.timedelta64(0)], return_counts=True)
+    return pd.Timedelta(values[counts.argmax()])
+
+
+class _Batch:
+    """
+    the requests of one model answered by one predict call
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ForecastService:
+    """
+    Arguments:
+        - registry_paths: folders of the model registries to serve (default: those of the Prophet and Darts pipelines)
+        - regressors: df of regressor values indexed by date (e.g. the climate regressors of the pipelines), for the models
+          trained with regressors; dates it does not cover take the last value the model was trained on
+        - batch_window, cache_size, max_models: see above
+    """
+
+    def __init__(self, registry_paths=None, regressors=None, batch_window=BATCH_WINDOW, cache_size=CACHE_SIZE, max_models=MAX_MODELS):
+        if registry_paths is None:
+            registry_paths = [config.MODEL_REGISTRY_PATH, darts_config.MODEL_REGISTRY_PATH]
+        self.registries = [ModelRegistry(path) for path in registry_paths]
+        self.regressors = regressors
+        self.batch_window = batch_window
+        self.cache_size = cache_size
+        self.max_models = max_models
+        self.lock = threading.Lock()
+        # {(registry path, model key): (version, model)} and {(registry path, model key, version): forecast df}, least recently used first
+        self.models = OrderedDict()
+        self.cache = OrderedDict()
+        self.batches = {}
+        self.covariates = {}
+        self.stats = {'requests': 0, 'cache_hits': 0, 'predict_calls': 0, 'model_loads': 0}
+
+    def lookup(self, file, column, model, name=None):
+        """
+        (registry, model key, index entry) of the most recently saved model of a series; raises KeyError if there is none
+            - model: 'prophet', or the name of a Darts model (e.g. 'ARIMA')
+            - name: label the model was saved under (e.g. 'retrained_model'), any label if None
+        """
+        matches = [(registry, key, entry) for registry in self.registries for (key, entry) in registry.find(file, column, model, name=name)]
+        if not matches:
+            raise KeyError(f"no saved {model} model of '{column}' in '{file}'")
+        return max(matches, key=lambda match: ModelRegistry.save_order(match[2]))
+
+    def data_version(self, file, entry):
+        """
+        changes whenever new data arrives for the series: a newer model is saved, or its sensor file is modified
+        """
+        try:
+            mtime = os.stat(os.path.sep.join([config.DATASHEETS_PATH, file])).st_mtime_ns
+        except (OSError, TypeError):
+            mtime = None
+        return (ModelRegistry.save_order(entry), mtime)
+
+    def forecast(self, file, column, model, steps, name=None):
+        """
+        the forecast of the next 'steps' steps of a series: {'ds', 'yhat', 'yhat_lower', 'yhat_upper', 'model_key', 'cached'}
+        """
+        if steps < 1:
+            raise ValueError('steps must be at least 1')
+        registry, key, entry = self.lookup(file, column, model, name)
+        version = self.data_version(file, entry)
+        cache_key = (registry.registry_dir, key, version)
+        with self.lock:
+            self.stats['requests'] += 1
+            forecast = self.cached(cache_key, steps)
+            if forecast is not None:
+                self.stats['cache_hits'] += 1
+                return self.response(forecast, steps, key, True)
+            # join the open batch of this model, or open one
+            batch = self.batches.get(cache_key)
+            leader = batch is None
+            if leader:
+                batch = self.batches[cache_key] = _Batch()
+            batch.steps.append(steps)
+
+        if leader:
+            time.sleep(self.batch_window)
+            with self.lock:
+                del self.batches[cache_key]
+            try:
+                batch.result = self.predict(registry, key, entry, version, max(batch.steps))
+                with self.lock:
+                    self.store(cache_key, batch.result)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return self.response(batch.result, steps, key, False)
+
+    @staticmethod
+    def response(forecast, steps, key, cached):
+        forecast = forecast.iloc[:steps]
+        response = {'ds': [str(ds) for ds in forecast['ds']]}
+        for col in ['yhat', 'yhat_lower', 'yhat_upper']:
+            if col in forecast:
+                response[col] = forecast[col].tolist()
+        response.update({'model_key': key, 'cached': cached})
+        return response
+
+    def cached(self, cache_key, steps):
+        forecast = self.cache.get(cache_key)
+        if forecast is None or len(forecast) < steps:
+            return None
+        self.cache.move_to_end(cache_key)
+        return forecast
+
+    def store(self, cache_key, forecast):
+        # a forecast of an older version of the same model is stale: new data arrived
+        for stale_key in [k for k in self.cache if k[:2] == cache_key[:2] and k != cache_key]:
+            del self.cache[stale_key]
+        current = self.cache.get(cache_key)
+        if current is None or len(current) < len(forecast):
+            self.cache[cache_key] = forecast
+        self.cache.move_to_end(cache_key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def warm_model(self, registry, key, version):
+        """
+        the model saved under 'key', loaded from the registry only if it is not in memory yet (or a newer one was saved)
+        """
+        model_id = (registry.registry_dir, key)
+        with self.lock:
+            if model_id in self.models and self.models[model_id][0] == version:
+                self.models.move_to_end(model_id)
+                return self.models[model_id][1]
+        model = registry.load(key)
+        with self.lock:
+            self.stats['model_loads'] += 1
+            self.models[model_id] = (version, model)
+            self.models.move_to_end(model_id)
+            while len(self.models) > self.max_models:
+                self.models.popitem(last=False)
+        return model
+
+    def predict(self, registry, key, entry, version, steps):
+        """
+        ONE predict call of the model: a df('ds', 'yhat'[, 'yhat_lower', 'yhat_upper']) of the next 'steps' steps
+        """
+        model = self.warm_model(registry, key, version)
+        with self.lock:
+            self.stats['predict_calls'] += 1
+        if entry['model_type'] == 'prophet':
+            return self.predict_prophet(model, steps)
+        return self.predict_darts(entry['model_type'], model, steps)
+
+    def predict_prophet(self, m, steps):
+        from Prophet.fb_prophet_train_forecast import model_history
+        future = m.make_future_dataframe(periods=steps, freq=history_freq(m.history['ds']), include_history=False)
+        if m.extra_regressors:
+            history = model_history(m)
+            for regressor_name in m.extra_regressors:
+                values = pd.Series(np.nan, index=future['ds'])
+                if self.regressors is not None and regressor_name in self.regressors:
+                    values = self.regressors[regressor_name].reindex(pd.DatetimeIndex(future['ds']))
+                future[regressor_name] = values.fillna(history[regressor_name].iloc[-1]).values
+        return m.predict(future)[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+    def predict_darts(self, name, m, steps):
+        # Darts is imported only if a Darts model is asked for, it may not be installed
+        from Darts.brock_comm_CLT_perform import Darts_CLT_Perform
+        p = Darts_CLT_Perform.predict(name, m, self.darts_covariates(), steps)
+        forecast = p.pd_dataframe()
+        return pd.DataFrame({'ds': forecast.index, 'yhat': forecast.iloc[:, 0].values})
+
+    def darts_covariates(self):
+        """
+        the regressors as a Darts TimeSeries, built once; None without regressors
+        """
+        if self.regressors is None:
+            return None
+        if 'series' not in self.covariates:
+            from darts import TimeSeries
+            from Darts.brock_comm_CLT_perform import Darts_CLT_Perform
+            regressors = self.regressors.rename_axis('ds').reset_index() if 'ds' not in self.regressors else self.regressors.reset_index(drop=True)
+            value_cols = [col for col in regressors.columns if col != 'ds']
+            self.covariates['series'] = TimeSeries.from_dataframe(regressors, 'ds', value_cols, freq=Darts_CLT_Perform.detect_freq(regressors['ds']))
+        return self.covariates['series']
+
+    def model_list(self):
+        """
+        the saved models that can be served, one dict each
+        """
+        return [{'model_key': key, **{field: entry[field] for field in ['file', 'column', 'model_type', 'name', 'params', 'saved']}}
+                for registry in self.registries for (key, entry) in registry.find()]
+
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    """
+    GET /forecast?file=&column=&model=&steps=[&name=], GET /models, GET /stats; every answer is json
+    """
+
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {field: values[-1] for (field, values) in parse_qs(url.query).items()}
+        try:
+            if url.path == '/forecast':
+                missing = [field for field in ['file', 'column', 'model', 'steps'] if field not in query]
+                if missing:
+                    raise ValueError(f"missing parameters: {missing}")
+                body = self.service.forecast(query['file'], query['column'], query['model'], int(query['steps']), query.get('name'))
+            elif url.path == '/models':
+                body = self.service.model_list()
+            elif url.path == '/stats':
+                body = dict(self.service.stats)
+            else:
+                return self.reply(404, {'error': f"unknown path {url.path}"})
+        except KeyError as e:
+            return self.reply(404, {'error': e.args[0]})
+        except ValueError as e:
+            return self.reply(400, {'error': str(e)})
+        except Exception as e:
+            return self.reply(500, {'error': f"{type(e).__name__}: {e}"})
+        self.reply(200, body)
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # one line per request on stderr is too much for a dashboard polling the service
+        pass
+
+
+def make_server(service, host=HOST, port=PORT):
+    """
+    the HTTP server of 'service' (port 0 = any free port, see server.server_address); one thread per request
+    """
+    handler = type('Handler', (ForecastHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve forecasts of the saved Prophet and Darts models on the local interface')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--registries', nargs='+', help='model registry folders (default: those of the Prophet and Darts pipelines)')
+    parser.add_argument('--no-regressors', action='store_true', help='forecast without the climate regressors (the last trained values are repeated)')
+    args = parser.parse_args()
+
+    regressors = None
+    if not args.no_regressors:
+        from Prophet.prediction import prepare_regressors
+        regressors = prepare_regressors()[0][1]
+    server = make_server(ForecastService(args.registries, regressors), HOST, args.port)
+    print(f"Serving forecasts on http://{HOST}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,298 @@
+"""
+This helper loads the sensor datasheets exported from Brock Commons into a clean dataframe, shared by the Prophet and Darts pipelines:
+    - 'NULL' cells and padding white space are handled while the csv is parsed (no per-cell clean-up afterwards)
+    - the 'DateTime' column is converted in one vectorized pass (timezone suffix, e.g. '-0700', is dropped)
+    - the parsed sheet is kept in a columnar cache (.npy arrays + a json sidecar), so repeated runs skip parsing
+    - streaming mode (stream_sensor_sheet) reads the csv in chunks and keeps only the columns asked for, as float32,
+      so peak memory is bounded by the chunk size and the kept columns, not by the whole sheet
+    - the pipelines hold a sheet as a compact Worksheet: a sorted DatetimeIndex, ONE 2-D float32 (or float64) array of the
+      sensor values and a name -> column map; date and time parts are derived only when asked for (load_worksheet)
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import hashlib
+import json
+import os
+import warnings
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+
+class IngestHelp:
+    """
+    Arguments:
+        - cache_dir: folder of the columnar cache; no cache is used if None
+    """
+
+    # bump this whenever the layout of the cached arrays changes
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def load_sensor_sheet(self, sheet_path):
+        """
+        returns a dataframe with a 'DateTime' column (datetime64) followed by one float column per sensor
+        """
+        if self.cache_dir is None:
+            return self.parse_sensor_sheet(sheet_path)
+
+        cached = self._read_cache(sheet_path)
+        if cached is not None:
+            return cached
+
+        worksheet = self.parse_sensor_sheet(sheet_path)
+        self._write_cache(sheet_path, worksheet)
+        return worksheet
+
+    def sheet_shape(self, sheet_path):
+        """
+        column names (white space removed, as in parse_sensor_sheet) and number of rows of a raw sensor csv, without parsing it
+        """
+        columns = [x.strip() for x in pd.read_csv(sheet_path, index_col=False, skipinitialspace=True, nrows=0).columns]
+        with open(sheet_path, 'rb') as fin:
+            n_rows = sum(1 for _ in fin) - 1
+        return columns, n_rows
+
+    def parse_sensor_sheet(self, sheet_path):
+        """
+        parse a raw sensor csv, cells look like ' NULL ' or '-2.37375' and timestamps like '2016-04-30 23:00:00-0700'
+        """
+        # skipinitialspace strips the leading pad, so ' NULL ' reaches the NA check as 'NULL '
+        worksheet = pd.read_csv(sheet_path, index_col=False, skipinitialspace=True, na_values=['NULL', 'NULL '])
+        # - remove white space for column names
+        worksheet.columns = [x.strip() for x in list(worksheet.columns)]
+        # - sensor columns are numeric once 'NULL' is gone; coerce anything else left over (e.g. trailing blanks)
+        for col_name in worksheet.columns[1:]:
+            if worksheet[col_name].dtype == object:
+                worksheet[col_name] = pd.to_numeric(worksheet[col_name].str.strip(), errors='coerce')
+        # - slice to exclude timezone info, then convert all the timestamps at once
+        worksheet['DateTime'] = pd.to_datetime(worksheet['DateTime'].str.strip().str[:-5], format="%Y-%m-%d %H:%M:%S")
+
+        return worksheet
+
+    def load_worksheet(self, sheet_path, columns=None, agg=False, dtype=np.float32, streaming=False, chunk_rows=20000):
+        """
+        the sheet as a Worksheet of the sensor columns 'columns' (all of them if None), plus 'Aggregate' if agg (see Worksheet.from_frame)
+            - streaming: read the csv in chunks (see stream_sensor_sheet) instead of parsing it whole / reading the columnar cache
+        """
+        if streaming:
+            return Worksheet.from_frame(self.stream_sensor_sheet(sheet_path, columns, agg, chunk_rows, dtype), dtype=dtype)
+        return Worksheet.from_frame(self.load_sensor_sheet(sheet_path), columns, agg, dtype)
+
+    def stream_sensor_sheet(self, sheet_path, columns=None, agg=False, chunk_rows=20000, dtype=np.float32):
+        """
+        same layout as parse_sensor_sheet ('DateTime' column followed by sensor columns), read chunk by chunk and keeping only:
+            - columns: the sensor columns to keep (white space removed), all of them if None
+            - agg: True adds the 'Aggregate' column, the mean of every sensor column of a row (NaN skipped), computed chunk by chunk;
+              columns=[] with agg=True keeps the aggregate only
+        values are stored as 'dtype' (float32 halves the memory of the sheet); the columnar cache is not used
+        """
+        header = [x.strip() for x in pd.read_csv(sheet_path, index_col=False, skipinitialspace=True, nrows=0).columns]
+        sensor_columns = header[1:]
+        keep = sensor_columns if columns is None else [col_name for col_name in sensor_columns if col_name in set(columns)]
+        # the aggregate needs every sensor column, otherwise only the kept ones are parsed
+        parsed = set(header) if agg else set(['DateTime'] + keep)
+        reader = pd.read_csv(sheet_path, index_col=False, skipinitialspace=True, na_values=['NULL', 'NULL '],
+                             usecols=lambda name: name.strip() in parsed, chunksize=chunk_rows)
+
+        timestamps, chunks = [], {col_name: [] for col_name in keep + (['Aggregate'] if agg else [])}
+        for chunk in reader:
+            chunk.columns = [x.strip() for x in list(chunk.columns)]
+            for col_name in chunk.columns[1:]:
+                if chunk[col_name].dtype == object:
+                    chunk[col_name] = pd.to_numeric(chunk[col_name].str.strip(), errors='coerce')
+            timestamps.append(pd.to_datetime(chunk['DateTime'].str.strip().str[:-5], format="%Y-%m-%d %H:%M:%S").values)
+            for col_name in keep:
+                chunks[col_name].append(chunk[col_name].to_numpy(dtype=dtype))
+            if agg:
+                # mean over the sensors in float64, as pandas does: rows without any reading stay NaN
+                values = chunk[sensor_columns].to_numpy(dtype=np.float64)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=RuntimeWarning)
+                    chunks['Aggregate'].append(np.nanmean(values, axis=1).astype(dtype))
+
+        worksheet = {'DateTime': np.concatenate(timestamps) if timestamps else np.array([], dtype='datetime64[ns]')}
+        for col_name in list(chunks):
+            # concatenate one column at a time, freeing its chunks right away
+            worksheet[col_name] = np.concatenate(chunks.pop(col_name)) if timestamps else np.array([], dtype=dtype)
+        return pd.DataFrame(worksheet, copy=False)
+
+    def file_digest(self, file_path):
+        """
+        sha1 of the file content, read in blocks
+        """
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as fin:
+            for block in iter(lambda: fin.read(1 << 20), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def _cache_stem(self, sheet_path):
+        # the same file name may live in several folders, so key on the normalized path as well
+        path_key = hashlib.sha1(os.path.normcase(os.path.abspath(sheet_path)).encode('utf-8')).hexdigest()[:10]
+        base_name = os.path.splitext(os.path.basename(sheet_path))[0]
+        return os.path.sep.join([self.cache_dir, f"{base_name}-{path_key}"])
+
+    def _read_cache(self, sheet_path):
+        stem = self._cache_stem(sheet_path)
+        try:
+            with open(stem + '.meta.json', 'r') as fin:
+                meta = json.load(fin)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get('version') != self.CACHE_VERSION:
+            return None
+
+        # cheap check first (mtime & size); only hash the file if the mtime moved
+        stat = os.stat(sheet_path)
+        if stat.st_size != meta['size']:
+            return None
+        if stat.st_mtime_ns != meta['mtime_ns']:
+            if self.file_digest(sheet_path) != meta['sha1']:
+                return None
+            # same content, just touched: refresh the mtime so the next run skips the hash
+            meta['mtime_ns'] = stat.st_mtime_ns
+            with open(stem + '.meta.json', 'w') as fout:
+                json.dump(meta, fout)
+
+        try:
+            timestamps = np.load(stem + '.datetime.npy')
+            values = np.load(stem + '.values.npy')
+        except (OSError, ValueError):
+            return None
+
+        worksheet = pd.DataFrame(values, columns=meta['columns'])
+        worksheet.insert(0, 'DateTime', timestamps)
+        return worksheet
+
+    def _write_cache(self, sheet_path, worksheet):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stem = self._cache_stem(sheet_path)
+        stat = os.stat(sheet_path)
+        meta = {
+            'version': self.CACHE_VERSION,
+            'source': sheet_path,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha1': self.file_digest(sheet_path),
+            'columns': [col_name for col_name in worksheet.columns if col_name != 'DateTime'],
+        }
+        np.save(stem + '.datetime.npy', worksheet['DateTime'].values.astype('datetime64[ns]'))
+        np.save(stem + '.values.npy', worksheet[meta['columns']].to_numpy(dtype=np.float64))
+        # write the sidecar last, so a half-written cache entry is never picked up
+        with open(stem + '.meta.json', 'w') as fout:
+            json.dump(meta, fout)
+
+
+class Worksheet:
+    """
+    compact in-memory sensor sheet, used by CLT_perform and Darts_CLT_Perform:
+        - index: sorted DatetimeIndex of the readings (the 'DateTime' column of the sheet)
+        - values: ONE 2-D array (rows x columns), column-major so that every column is a contiguous view
+        - columns: names of the columns of 'values'; position of a name in self.positions
+    read access mimics a dataframe: ws['col'] / ws['DateTime'] are Series (no copy of the values), ws[['col', ...]] a df,
+    ws['Date'] / ws['Time'] the date and time parts, derived on first use only
+    """
+
+    def __init__(self, index, values, columns):
+        self.index = pd.DatetimeIndex(index, name='DateTime')
+        self.values = np.asfortranarray(values)
+        self.columns = list(columns)
+        self.positions = {col_name: j for (j, col_name) in enumerate(self.columns)}
+        if self.values.shape != (len(self.index), len(self.columns)):
+            raise ValueError(f"values of shape {self.values.shape} for {len(self.index)} timestamps and {len(self.columns)} columns")
+
+    @classmethod
+    def from_frame(cls, frame, columns=None, agg=False, dtype=np.float32):
+        """
+        the worksheet of a df in the layout of IngestHelp.parse_sensor_sheet ('DateTime' followed by the sensor columns), keeping only:
+            - columns: the sensor columns to keep, all of them if None
+            - agg: True adds the 'Aggregate' column, the mean of every sensor column of a row (NaN skipped), computed in float64
+        rows are sorted by timestamp if they are not already (stable, so duplicated timestamps keep their order)
+        """
+        sensor_columns = [col_name for col_name in frame.columns if col_name != 'DateTime']
+        keep = sensor_columns if columns is None else [col_name for col_name in sensor_columns if col_name in set(columns)]
+        values = np.empty((len(frame), len(keep) + int(agg)), dtype=dtype, order='F')
+        for j, col_name in enumerate(keep):
+            values[:, j] = frame[col_name].to_numpy()
+        if agg:
+            with warnings.catch_warnings():
+                # rows without any reading
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                values[:, -1] = np.nanmean(frame[sensor_columns].to_numpy(dtype=np.float64), axis=1)
+        index = pd.DatetimeIndex(frame['DateTime'])
+        if not index.is_monotonic_increasing:
+            order = np.argsort(index.values, kind='stable')
+            index, values = index[order], values[order]
+        return cls(index, values, keep + (['Aggregate'] if agg else []))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, col_name):
+        return col_name in self.positions or col_name in ('DateTime', 'Date', 'Time')
+
+    def __getitem__(self, key):
+        if isinstance(key, list):
+            return pd.DataFrame({col_name: self[col_name] for col_name in key})
+        if key == 'DateTime':
+            return pd.Series(self.index.values, name='DateTime')
+        if key == 'Date':
+            return pd.Series(self.dates, name='Date')
+        if key == 'Time':
+            return pd.Series(self.times, name='Time')
+        return pd.Series(self.column(key), name=key, copy=False)
+
+    def column(self, col_name):
+        """
+        the values of one column, a view of self.values
+        """
+        return self.values[:, self.positions[col_name]]
+
+    def take(self, col_names, dtype=None):
+        """
+        the values of several columns, as a (rows x len(col_names)) array
+        """
+        return self.values[:, [self.positions[col_name] for col_name in col_names]].astype(dtype or self.values.dtype, copy=False)
+
+    @cached_property
+    def dates(self):
+        return self.index.date
+
+    @cached_property
+    def times(self):
+        return self.index.time
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.index.nbytes
+
+    def append(self, frame):
+        """
+        a new worksheet with the rows of 'frame' (a df with 'DateTime' and every column of this worksheet) appended
+        """
+        values = np.empty((len(self) + len(frame), len(self.columns)), dtype=self.values.dtype, order='F')
+        values[:len(self)] = self.values
+        values[len(self):] = frame[self.columns].to_numpy()
+        return Worksheet(self.index.append(pd.DatetimeIndex(frame['DateTime'])), values, self.columns)
+
+    def to_frame(self):
+        """
+        the worksheet as a df in the layout of IngestHelp.parse_sensor_sheet (a copy)
+        """
+        frame = pd.DataFrame(self.values, columns=self.columns)
+        frame.insert(0, 'DateTime', self.index.values)
+        return frame
+
+    def __repr__(self):
+        rows = np.r_[0:min(5, len(self)), max(5, len(self) - 5):len(self)]
+        head = pd.DataFrame(self.values[rows], index=self.index[rows], columns=self.columns)
+        return f"{head}\n[{len(self)} rows x {len(self.columns)} columns, {self.values.dtype}, {self.nbytes / 2**20:.1f} MB]"
@@ -0,0 +1,86 @@
+"""
+This helper sets up the logging shared by CLT_perform and Darts_CLT_Perform:
+    - handlers are configured once per process, however many instances (files) a run creates
+    - loggers only put their records on a queue; one background thread (QueueListener) writes them to the log file,
+      so the forecasting loop never waits for file I/O
+    - worker processes of every pool (files, grid candidates, backtest cutoffs, figures) send their records to the queue of the parent
+      (see worker_logging_args), so a run has one writer
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+
+LOG_FORMAT = '%(asctime)s : %(levelname)s : %(name)s : %(message)s'
+
+# per process: the queue handler shared by every logger, and the listener writing the queue (parent process only)
+_queue_handler = None
+_listener = None
+_level = logging.INFO
+
+
+def setup_logging(log_path, log_level='INFO'):
+    """
+    starts the background writer of this process; only the first call has an effect (later destinations and levels are ignored)
+    """
+    global _queue_handler, _listener, _level
+    if _queue_handler is not None:
+        return
+
+    file_handler = logging.FileHandler(log_path)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    # a multiprocessing queue, so worker processes can write to it too
+    log_queue = multiprocessing.Queue(-1)
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    # flush the queue before the interpreter exits
+    atexit.register(_listener.stop)
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _level = logging.getLevelName(log_level) if isinstance(log_level, str) else log_level
+
+
+def worker_logging_args():
+    """
+    initargs for a process pool: ProcessPoolExecutor(initializer=worker_logging, initargs=worker_logging_args()), for EVERY pool whose workers may log
+    in a worker itself, this is the queue of the parent, so the workers of nested pools write through the same listener
+    if logging is not set up in this process, the workers set up their own on their first get_logger, as this process would
+    """
+    if _queue_handler is None:
+        return (None, _level)
+    return (_queue_handler.queue, _level)
+
+
+def worker_logging(log_queue, log_level):
+    """
+    pool initializer: loggers of the worker put their records on the queue of the parent instead of writing a file themselves
+    """
+    global _queue_handler, _level
+    if log_queue is None:
+        return
+    inherited_handler = _queue_handler
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _level = log_level
+    # forked workers come with the loggers (and the handler) of the parent, swap it so records are not queued twice
+    if inherited_handler is not None:
+        for logger in logging.Logger.manager.loggerDict.values():
+            if isinstance(logger, logging.Logger) and inherited_handler in logger.handlers:
+                logger.removeHandler(inherited_handler)
+                logger.addHandler(_queue_handler)
+
+
+def get_logger(name, log_path, log_level='INFO'):
+    """
+    returns the logger 'name' writing (through the queue) to log_path; the handler is attached once, however often this is called
+    """
+    setup_logging(log_path, log_level)
+    logger = logging.getLogger(name)
+    logger.setLevel(_level)
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
+    return logger
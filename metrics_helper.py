@@ -0,0 +1,133 @@
+"""
+This helper records how long each stage of the Prophet and Darts pipelines takes, to see where the running time goes:
+    - one record per timed stage: wall time, CPU time (of the process), rows processed, peak RSS of the process, series name
+    - worker processes keep their own records, which are sent back with their results and merged by the parent (see drain/extend)
+    - the records of a run are written to a json and a csv report (see write_report)
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import glob
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# peak RSS: 'resource' on Linux/macOS, psutil (if installed) on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peak_rss_mb():
+    """
+    peak resident memory of this process so far in MB, or None if it cannot be read on this platform
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+    if psutil is not None:
+        return psutil.Process().memory_info().peak_wset / 2**20
+    return None
+
+
+class StageMetrics:
+    """
+    collects the records of the timed stages of ONE process; use the module-level 'stage_metrics' instance
+    """
+
+    def __init__(self):
+        self.records = []
+        # name of the series being processed, filled into the records that do not set their own
+        self.series = None
+
+    @contextmanager
+    def stage(self, stage, series=None, rows=None):
+        """
+        times the code of a 'with' block; the record is yielded, so e.g. 'rows' can be set once it is known
+        """
+        record = {'stage': stage, 'series': series if series is not None else self.series, 'rows': rows, 'pid': os.getpid(), 'start': time.time()}
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            record['peak_rss_mb'] = peak_rss_mb()
+            self.records.append(record)
+
+    def drain(self, since=0):
+        """
+        removes and returns the records added after the first 'since' ones, e.g. to send them back from a worker process
+        """
+        drained = self.records[since:]
+        del self.records[since:]
+        return drained
+
+    def extend(self, records):
+        """
+        adds records of another process (or StageMetrics); records without a series get the current one
+        """
+        for record in records:
+            if record['series'] is None:
+                record['series'] = self.series
+            self.records.append(record)
+
+    def summary(self):
+        """
+        total wall time, CPU time and rows per stage, slowest stage first
+        """
+        records = pd.DataFrame(self.records)
+        if records.empty:
+            return records
+        summary = records.groupby('stage').agg(count=('wall_s', 'size'), wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum'), rows=('rows', 'sum'), peak_rss_mb=('peak_rss_mb', 'max'))
+        return summary.sort_values('wall_s', ascending=False)
+
+    def write_report(self, report_stem):
+        """
+        writes every record to '<report_stem>.json' and '<report_stem>.csv'
+        """
+        os.makedirs(os.path.dirname(report_stem) or '.', exist_ok=True)
+        with open(report_stem + '.json', 'w') as fout:
+            json.dump(self.records, fout, indent=1)
+        pd.DataFrame(self.records).to_csv(report_stem + '.csv', index=False)
+
+
+def load_reports(pattern, last=5):
+    """
+    records of the last 'last' reports matching the glob 'pattern' (e.g. 'output/run_metrics_*.json'), by name, in one df
+    """
+    records = []
+    for report_json in sorted(glob.glob(pattern))[-last:]:
+        with open(report_json, 'r') as fin:
+            records += json.load(fin)
+    return pd.DataFrame(records)
+
+
+def stage_costs(records):
+    """
+    median wall time of every stage in a df of records: per record ('per_call') and per row processed ('per_row', stages recording rows only)
+    """
+    if records.empty:
+        return {'per_call': pd.Series(dtype=float), 'per_row': pd.Series(dtype=float)}
+    with_rows = records[pd.to_numeric(records['rows'], errors='coerce') > 0]
+    return {
+        'per_call': records.groupby('stage')['wall_s'].median(),
+        'per_row': (with_rows['wall_s'] / with_rows['rows'].astype(float)).groupby(with_rows['stage']).median(),
+    }
+
+
+# the records of this process
+stage_metrics = StageMetrics()
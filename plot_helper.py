@@ -0,0 +1,186 @@
+"""
+This helper renders the figures of the Prophet and Darts pipelines and of Results_Analysis off the critical path:
+    - figures are drawn with the object-oriented matplotlib API on the non-interactive Agg canvas: no window, no plt.show()
+      blocking the run, and no figure left open in the pyplot registry once it is saved
+    - rendering runs in background worker processes, so forecasting goes on while the figures are drawn; close() waits for them
+    - series longer than 'max_points' are downsampled with LTTB (Largest-Triangle-Three-Buckets) before drawing,
+      which keeps the peaks and troughs that plain decimation would drop
+    - dpi and file format are configurable, and 'enabled=False' skips rendering altogether (for throughput runs)
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from log_helper import worker_logging, worker_logging_args
+
+# colours of Prophet's built-in forecast plot, see: https://facebook.github.io/prophet/docs/quick_start.html#python-api
+FORECAST_COLOR = '#0072B2'
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: positions of the n_out points of (x, y) that best keep the visual shape of the line;
+    the first and last points are always kept. x may be numeric or datetime, anything else is treated as evenly spaced
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = pd.Series(x)
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.astype('int64').to_numpy(dtype=float)
+    elif pd.api.types.is_numeric_dtype(x):
+        x = x.to_numpy(dtype=float)
+    else:
+        x = np.arange(n, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # n_out-2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    with warnings.catch_warnings():
+        # all-NaN buckets
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for b in range(n_out - 2):
+            start, end = edges[b], edges[b + 1]
+            # third corner of the triangle: the average point of the next bucket (the last point for the last bucket)
+            if b < n_out - 3:
+                x_c, y_c = x[end:edges[b + 2]].mean(), np.nanmean(y[end:edges[b + 2]])
+            else:
+                x_c, y_c = x[-1], y[-1]
+            area = np.abs((x[a] - x_c) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (y_c - y[a]))
+            a = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+            selected[b + 1] = a
+    return selected
+
+
+def downsample(df, x_col, y_col, max_points):
+    """
+    rows of df kept by LTTB on (x_col, y_col); df is returned as is if it has max_points rows or less
+    """
+    if max_points is None or len(df) <= max_points:
+        return df
+    return df.iloc[lttb(df[x_col], df[y_col], max_points)]
+
+
+def render_forecast(fig_path, history, forecast, col_name, dpi):
+    """
+    the figure of Prophet's built-in plot: observed points (history: df('ds', 'y')), forecast line and uncertainty interval
+    (forecast: df('ds', 'yhat', 'yhat_lower', 'yhat_upper'))
+    """
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    ax.plot(history['ds'], history['y'], 'k.', label='Observed data points')
+    ax.plot(forecast['ds'], forecast['yhat'], ls='-', c=FORECAST_COLOR, label='Forecast')
+    ax.fill_between(forecast['ds'], forecast['yhat_lower'], forecast['yhat_upper'], color=FORECAST_COLOR, alpha=0.2, label='Uncertainty interval')
+    ax.grid(True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+    ax.set_xlabel("Time", size=20)
+    ax.set_ylabel(col_name, size=20)
+    fig.tight_layout()
+    fig.savefig(fig_path, dpi=dpi)
+
+
+def render_lines(fig_path, lines, xlabel, ylabel, dpi, band=None, rotate_xticks=False):
+    """
+    Arguments:
+        - lines: [(label, x, y)], one line each
+        - band: (x, lower, upper) filled between lower and upper, or None
+    """
+    fig = Figure(figsize=(10, 8))
+    ax = fig.add_subplot(111)
+    for label, x, y in lines:
+        ax.plot(x, y, label=label)
+    if band is not None:
+        ax.fill_between(*band, color='y', alpha=.5)
+    if rotate_xticks:
+        ax.tick_params(axis='x', labelrotation=90)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.legend(loc='best')
+    fig.tight_layout()
+    fig.savefig(fig_path, dpi=dpi)
+
+
+class PlotHelp:
+    """
+    Arguments:
+        - enabled: False skips every figure (nothing is rendered nor written)
+        - dpi, fmt: resolution and file format ('png', 'svg', 'pdf', ...) of the saved figures
+        - max_points: longest series drawn as is, longer ones are downsampled with LTTB (None = never downsample)
+        - n_workers: background processes rendering the figures (0 = render in the calling process, before returning)
+    """
+
+    def __init__(self, enabled=True, dpi=600, fmt='png', max_points=2000, n_workers=1):
+        self.enabled = enabled
+        self.dpi = dpi
+        self.fmt = fmt
+        self.max_points = max_points
+        self.n_workers = n_workers
+        self.pool = None
+        self.pending = []
+
+    def fig_path(self, output_path, fig_name):
+        return os.path.sep.join([output_path, '{}.{}'.format(fig_name, self.fmt)])
+
+    def submit(self, render, *args):
+        """
+        run render(*args) in the background (or right away with n_workers=0); errors are raised by close()
+        """
+        if self.n_workers == 0:
+            render(*args)
+            return
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.n_workers, initializer=worker_logging, initargs=worker_logging_args())
+        self.pending.append(self.pool.submit(render, *args))
+
+    def forecast_plot(self, output_path, fig_name, history, forecast, col_name):
+        """
+        Prophet forecast figure, see render_forecast; only the needed columns of the downsampled series are sent to the worker
+        """
+        if not self.enabled:
+            return
+        history = downsample(history[['ds', 'y']], 'ds', 'y', self.max_points)
+        forecast = downsample(forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']], 'ds', 'yhat', self.max_points)
+        self.submit(render_forecast, self.fig_path(output_path, fig_name), history, forecast, col_name, self.dpi)
+
+    def line_plot(self, output_path, fig_name, lines, xlabel, ylabel, band=None, rotate_xticks=False):
+        """
+        one figure of several lines, see render_lines; each line (and the band) is downsampled on its own
+        """
+        if not self.enabled:
+            return
+        if self.max_points is not None:
+            lines = [(label, *self.downsample_xy(x, y)) for label, x, y in lines]
+            if band is not None:
+                x, lower, upper = band
+                keep = lttb(x, (np.asarray(lower, dtype=float) + np.asarray(upper, dtype=float)) / 2, self.max_points)
+                band = tuple(np.asarray(values)[keep] for values in band)
+        self.submit(render_lines, self.fig_path(output_path, fig_name), lines, xlabel, ylabel, self.dpi, band, rotate_xticks)
+
+    def downsample_xy(self, x, y):
+        keep = lttb(x, y, self.max_points)
+        return np.asarray(x)[keep], np.asarray(y)[keep]
+
+    def close(self):
+        """
+        wait for the figures still being rendered and stop the workers; the first rendering error (if any) is raised here
+        """
+        pending, self.pending = self.pending, []
+        try:
+            for future in pending:
+                future.result()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
@@ -0,0 +1,147 @@
+"""
+This helper stores the trained models of the Prophet and Darts pipelines in a model registry, instead of one JSON dump per run:
+    - every model is kept under its (sensor file, column, model type, parameter set, name), so models of different floors, or an initial
+      and a retrained model of the same parameters, no longer overwrite each other
+    - saves are numbered in the index ('seq'), so the most recent model is known even for saves within the same second
+    - a model is one compressed binary file (pickle + zlib), smaller than the JSON of prophet.serialize and much faster to read
+    - a small json index lists every model, so looking a model up reads the index only, and loading it reads that one model file only (lazy)
+
+To list the models of a registry:
+    python registry_helper.py <registry_path>
+"""
+
+"""
+================
+Import libraries
+================
+"""
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import sys
+import zlib
+
+import pandas as pd
+
+
+class ModelRegistry:
+    """
+    Arguments:
+        - registry_dir: folder of the index and the model files
+        - compress_level: zlib level of the model files (1 = fastest, 9 = smallest)
+    [caution] one process should save models at a time (e.g. the parent process of a pool), as the index is rewritten on every save
+    """
+
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, registry_dir, compress_level=6):
+        self.registry_dir = registry_dir
+        self.compress_level = compress_level
+        self._index = None
+        self._index_mtime = None
+
+    @staticmethod
+    def params_key(params):
+        """
+        canonical text of a parameter set, the same whatever the order of the keys
+        """
+        return json.dumps(params, sort_keys=True, default=str)
+
+    def model_key(self, file, column, model_type, params, name=None):
+        return hashlib.sha1(json.dumps([file, column, model_type, self.params_key(params), name]).encode('utf-8')).hexdigest()[:20]
+
+    def index(self):
+        """
+        {model key: entry} of every model; read again only if another registry object saved since
+        """
+        index_path = os.path.sep.join([self.registry_dir, self.INDEX_NAME])
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._index is None or mtime != self._index_mtime:
+            with open(index_path, 'r') as fin:
+                self._index = json.load(fin)
+            self._index_mtime = mtime
+        return self._index
+
+    def save(self, model, file, column, model_type, params, name=None, versions=None):
+        """
+        stores 'model' under (file, column, model_type, params, name), replacing the model saved under the same ones; returns its key
+            - name: a label to find the model by, e.g. 'initially_trained_model'
+            - versions: e.g. library versions, kept in the index to tell which code the model file needs
+        """
+        key = self.model_key(file, column, model_type, params, name)
+        blob = zlib.compress(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL), self.compress_level)
+        self._write(key + '.pkl.z', 'wb', lambda fout: fout.write(blob))
+
+        index = dict(self.index())
+        seq = max((entry.get('seq', 0) for entry in index.values()), default=0) + 1
+        index[key] = {
+            'file': file,
+            'column': column,
+            'model_type': model_type,
+            'params': json.loads(self.params_key(params)),
+            'name': name,
+            'model_file': key + '.pkl.z',
+            'bytes': len(blob),
+            'saved': datetime.datetime.now().isoformat(timespec='seconds'),
+            'seq': seq,
+            'versions': versions,
+        }
+        self._write(self.INDEX_NAME, 'w', lambda fout: json.dump(index, fout, indent=1))
+        self._index, self._index_mtime = index, os.stat(os.path.sep.join([self.registry_dir, self.INDEX_NAME])).st_mtime_ns
+        return key
+
+    def find(self, file=None, column=None, model_type=None, params=None, name=None):
+        """
+        [(key, entry)] of the models matching every given argument, the most recently saved first
+        """
+        filters = {'file': file, 'column': column, 'model_type': model_type, 'name': name}
+        matches = [(key, entry) for (key, entry) in self.index().items()
+                   if all(value is None or entry[field] == value for (field, value) in filters.items())
+                   and (params is None or self.params_key(entry['params']) == self.params_key(params))]
+        return sorted(matches, key=lambda match: self.save_order(match[1]), reverse=True)
+
+    @staticmethod
+    def save_order(entry):
+        # entries of registries written before 'seq' was added come first, in order of 'saved'
+        return (entry.get('seq', 0), entry['saved'])
+
+    def load(self, key):
+        """
+        the model saved under 'key'; only its own file is read
+        """
+        with open(os.path.sep.join([self.registry_dir, self.index()[key]['model_file']]), 'rb') as fin:
+            return pickle.loads(zlib.decompress(fin.read()))
+
+    def get(self, **filters):
+        """
+        the most recently saved model matching 'filters' (see find), or None
+        """
+        matches = self.find(**filters)
+        return self.load(matches[0][0]) if matches else None
+
+    def entries(self):
+        """
+        the index as a df, one row per model
+        """
+        return pd.DataFrame([{'key': key, **entry} for (key, entry) in self.index().items()])
+
+    def _write(self, file_name, mode, write):
+        # write to a temporary file first, so a crash never leaves half a model file or index
+        os.makedirs(self.registry_dir, exist_ok=True)
+        path = os.path.sep.join([self.registry_dir, file_name])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode) as fout:
+            write(fout)
+        os.replace(tmp_path, path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('usage: python registry_helper.py <registry_path>')
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(ModelRegistry(sys.argv[1]).entries())
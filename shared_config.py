@@ -0,0 +1,43 @@
+"""
+This config file stores the settings shared by the Prophet and Darts pipelines; both Prophet/brock_comm_config.py and
+Darts/brock_comm_config.py import them, so config.<NAME> works the same in either pipeline
+"""
+import os
+
+# path to the columnar cache of parsed datasheets (see ingest_helper.py)
+INGEST_CACHE_PATH = os.path.join('cache', 'ingest')
+
+# streaming ingest: read the datasheets in chunks of INGEST_CHUNK_ROWS rows, parsing only the modelled columns (see ingest_helper.py)
+# bounds the peak memory of long/wide exports; the columnar cache above is not used then
+INGEST_STREAMING = False
+INGEST_CHUNK_ROWS = 20000
+
+# dtype of the sensor values held in memory (see Worksheet in ingest_helper.py): 'float32' halves the memory of a sheet, 'float64' keeps full precision
+WORKSHEET_DTYPE = 'float32'
+
+# path to the memory-mapped cache of prepared climate regressors (see regressor_helper.py)
+REGR_CACHE_PATH = os.path.join('cache', 'regressors')
+
+# columnar (Parquet) store of the result sheets (see export_helper.py); None writes the Excel workbooks directly
+RESULT_STORE_PATH = None
+# with a result store, also generate the Excel workbooks from it at the end of the run (otherwise: python export_helper.py <store>)
+RESULT_STORE_EXCEL = True
+
+# log file and level of CLT_perform/Darts_CLT_Perform, written by one background thread per run (see log_helper.py)
+LOG_PATH = 'CLT_perform.log'
+LOG_LEVEL = 'INFO'
+
+# rolling-origin backtests (CLT_perform.backtest, Darts_CLT_Perform.backtest), in 2-hour steps: train on at least BACKTEST_INITIAL steps (4380 = a year),
+# a cutoff every BACKTEST_PERIOD steps (1008 = 12 weeks), each forecasting BACKTEST_HORIZON steps; cutoffs are fitted on BACKTEST_N_JOBS processes (None = all cores)
+BACKTEST_INITIAL = 4380
+BACKTEST_PERIOD = 1008
+BACKTEST_HORIZON = 300
+BACKTEST_N_JOBS = None
+
+# figures (see plot_helper.py), rendered by PLOT_WORKERS background processes (0 = in the pipeline itself); PLOTS = False skips them all (throughput runs)
+# series longer than PLOT_MAX_POINTS are downsampled (LTTB) before drawing; PLOT_FORMAT is any format of matplotlib's savefig ('png', 'svg', 'pdf', ...)
+PLOTS = True
+PLOT_DPI = 600
+PLOT_FORMAT = 'png'
+PLOT_MAX_POINTS = 2000
+PLOT_WORKERS = 1